@@ -0,0 +1,123 @@
+#coding: utf-8
+"""
+asyncio flavour of fakedriver for AsyncHub, shaped like aiomysql:
+connect, cursor, execute, fetch*, commit and rollback are coroutines,
+and latency is awaited with asyncio.sleep instead of blocking the loop.
+
+>>> db = AsyncHub(afakedriver)
+>>> db.add_pool('default', host='fake', port=0, user='', db='bench',
+                latency=0.001, rows=100, columns=8)
+
+Connect arguments are the ones of fakedriver.
+"""
+import asyncio
+
+import fakedriver
+from fakedriver import Error, OperationalError, escape_string, literal
+
+
+class SSCursor:
+    pass
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._cursor = fakedriver.Cursor(conn._conn)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def _last_executed(self):
+        return self._cursor._last_executed
+
+    def mogrify(self, sql, args=None):
+        return self._cursor.mogrify(sql, args)
+
+    async def execute(self, sql, args=None):
+        if self.conn.latency:
+            await asyncio.sleep(self.conn.latency)
+        return self._cursor.execute(sql, args)
+
+    async def executemany(self, sql, args):
+        if self.conn.latency:
+            await asyncio.sleep(self.conn.latency)
+        return self._cursor.executemany(sql, args)
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    async def nextset(self):
+        return self._cursor.nextset()
+
+    async def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, latency=0.0, connect_latency=0.0, **kw):
+        self.latency = latency
+        # the sync connection never sleeps, latency is awaited here
+        self._conn = fakedriver.Connection(**kw)
+
+    @property
+    def open(self):
+        return self._conn.open
+
+    async def cursor(self, cursorclass=None):
+        return Cursor(self)
+
+    def literal(self, v):
+        return literal(v)
+
+    def escape_string(self, s):
+        return escape_string(s)
+
+    def get_autocommit(self):
+        return self._conn.get_autocommit()
+
+    async def autocommit(self, on):
+        self._conn.autocommit(on)
+
+    async def begin(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def commit(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def rollback(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def ping(self, reconnect=True):
+        return self._conn.ping(reconnect)
+
+    def character_set_name(self):
+        return self._conn.character_set_name()
+
+    def close(self):
+        self._conn.close()
+
+
+async def connect(connect_latency=0.0, **kw):
+    if connect_latency:
+        await asyncio.sleep(connect_latency)
+    return Connection(**kw)
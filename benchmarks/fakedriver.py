@@ -0,0 +1,178 @@
+#coding: utf-8
+"""
+In-process DB-API driver for benchmarks, no server needed.
+
+Behaviour is set by connect arguments, so Hub.add_pool passes them through:
+
+>>> db = Hub(fakedriver)
+>>> db.add_pool('default', host='fake', port=0, user='', db='bench',
+                latency=0.001, rows=100, columns=8)
+
+:param latency: seconds every statement sleeps, as a network round trip
+:param rows: rows returned by every select
+:param columns: columns of those rows
+:param connect_latency: seconds a new connection takes
+"""
+import sys
+import time
+import datetime
+import itertools
+
+py3k = sys.version_info.major > 2
+
+if py3k:
+    StringTypes = (str,)
+else:
+    StringTypes = (str, unicode)
+
+
+class Error(Exception):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+class cursors:
+    class SSCursor:
+        pass
+
+
+def escape_string(s):
+    return (s.replace('\\', '\\\\').replace("'", "\\'").replace('"', '\\"')
+             .replace('\n', '\\n').replace('\r', '\\r').replace('\x00', '\\0'))
+
+
+def literal(v):
+    if v is None:
+        return 'NULL'
+    if isinstance(v, bool):
+        return '1' if v else '0'
+    if isinstance(v, (int, float)):
+        return repr(v)
+    if isinstance(v, (list, tuple, set)):
+        return '(' + ','.join(literal(e) for e in v) + ')'
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return "'" + str(v) + "'"
+    if isinstance(v, bytes) and py3k:
+        v = v.decode('utf8', 'replace')
+    return "'" + escape_string(v if isinstance(v, StringTypes) else str(v)) + "'"
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = []
+        self._last_executed = None
+
+    def mogrify(self, sql, args=None):
+        if args is None:
+            return sql
+        if isinstance(args, dict):
+            return sql % dict((k, literal(v)) for k, v in args.items())
+        return sql % tuple(literal(a) for a in args)
+
+    def execute(self, sql, args=None):
+        q = self.mogrify(sql, args)
+        self._last_executed = q
+        conn = self.conn
+        if conn.latency:
+            time.sleep(conn.latency)
+        if q.split(None, 1)[0].lower() in ('select', 'explain', 'show'):
+            self.description = conn.description
+            self._rows = list(conn.result)
+            self.rowcount = len(self._rows)
+        else:
+            self.description = None
+            self._rows = []
+            self.rowcount = 1
+            self.lastrowid = next(conn.ids)
+        return self.rowcount
+
+    def executemany(self, sql, args):
+        n = 0
+        for a in args:
+            n += self.execute(sql, a)
+        self.rowcount = n
+        return n
+
+    def callproc(self, procname, args=()):
+        self.execute('select ' + procname)
+        return args
+
+    def fetchall(self):
+        rows, self._rows = tuple(self._rows), []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        self._rows = []
+
+
+class Connection:
+    def __init__(self, latency=0.0, rows=10, columns=5, connect_latency=0.0,
+                 autocommit=True, **kw):
+        if connect_latency:
+            time.sleep(connect_latency)
+        self.latency = latency
+        self.open = True
+        self._autocommit = autocommit
+        self.client_flag = kw.get('client_flag', 0)
+        self.ids = itertools.count(1)
+        names = ['id'] + ['c%d' % i for i in range(1, columns)]
+        self.description = tuple((name, None, None, None, None, None, None) for name in names)
+        self.result = tuple(tuple([i] + [u'value%d' % j for j in range(1, columns)])
+                            for i in range(rows))
+
+    def cursor(self, cursorclass=None):
+        return Cursor(self)
+
+    def literal(self, v):
+        return literal(v)
+
+    def escape_string(self, s):
+        return escape_string(s)
+
+    def get_autocommit(self):
+        return self._autocommit
+
+    def autocommit(self, on):
+        self._autocommit = on
+
+    def query(self, sql):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            raise OperationalError(2006, 'MySQL server has gone away')
+        return True
+
+    def character_set_name(self):
+        return 'utf8'
+
+    def close(self):
+        self.open = False
+
+
+def connect(**kw):
+    return Connection(**kw)
@@ -0,0 +1,295 @@
+#coding: utf-8
+"""
+Benchmarks of lorm hot paths against the in-process fakedriver.
+
+    python benchmarks/run.py                      # all, table on stdout
+    python benchmarks/run.py -k pool --threads 64
+    python benchmarks/run.py --json before.json
+    python benchmarks/run.py --json after.json --compare before.json
+
+--compare exits with status 1 when a benchmark lost more than --threshold
+of the baseline's throughput. Benchmarks of features missing from the lorm
+under test are skipped and a failing benchmark is reported as an error, so
+the suite also runs against older versions for their baseline.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lorm
+from lorm import mysql_pool
+from lorm.db import QuerySet
+import fakedriver
+
+BENCHMARKS = []
+
+
+class Skip(Exception):
+    "raised by a benchmark when the lorm under test lacks its feature"
+
+
+def bench(name, threaded=False):
+    "register a benchmark, a function of (db, options) returning the op to repeat"
+    def deco(f):
+        BENCHMARKS.append((name, threaded, f))
+        return f
+    return deco
+
+
+def make_hub(options, latency=0.0, rows=None):
+    db = lorm.Hub(fakedriver)
+    kw = {}
+    if options.pool_class != 'queue':
+        # older versions have only the queue pool
+        kw['pool_class'] = options.pool_class
+    db.add_pool('default', host='fake', port=0, user='bench', db='bench',
+                pool_size=options.pool_size, latency=latency,
+                rows=options.rows if rows is None else rows, columns=options.columns, **kw)
+    return db
+
+
+def measure(op, duration, threads=1, batch=1):
+    """
+    Repeat op in `threads` threads for about `duration` seconds.
+    Returns total ops, elapsed seconds and per-op latencies of a sample.
+    """
+    counts = [0] * threads
+    samples = [[] for _ in range(threads)]
+    errors = []
+    start = threading.Event()
+
+    def worker(i):
+        start.wait()
+        deadline = time.time() + duration
+        lat = samples[i]
+        n = 0
+        try:
+            while 1:
+                t = time.time()
+                if t >= deadline:
+                    break
+                for _ in range(batch):
+                    op()
+                lat.append((time.time() - t) / batch)
+                n += batch
+        except Exception as e:
+            errors.append(e)
+        counts[i] = n
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    t0 = time.time()
+    start.set()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - t0
+    if errors:
+        raise errors[0]
+    lat = sorted(l for s in samples for l in s)
+    return sum(counts), elapsed, lat
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+
+@bench('make_query')
+def bench_make_query(db, options):
+    qs = db.default.pets
+    def op():
+        qs.filter(age__gte=3, name__startswith='c').exclude(id__in=[1, 2, 3]) \
+          .order_by('-id').make_query(limits=[0, 20])
+    return op
+
+
+@bench('make_query_nocache')
+def bench_make_query_nocache(db, options):
+    if not hasattr(QuerySet, 'sql_cache'):
+        raise Skip('no compiled sql cache')
+    qs = db.default.pets
+    def op():
+        cache, QuerySet.sql_cache = QuerySet.sql_cache, None
+        try:
+            qs.filter(age__gte=3, name__startswith='c').exclude(id__in=[1, 2, 3]) \
+              .order_by('-id').make_query(limits=[0, 20])
+        finally:
+            QuerySet.sql_cache = cache
+    return op
+
+
+@bench('clone_chain')
+def bench_clone_chain(db, options):
+    qs = db.default.pets
+    def op():
+        qs.filter(age=1).filter(name='cat').exclude(id=3).order_by('-id').select('id', 'name').values()
+    return op
+
+
+@bench('fetchall_dict')
+def bench_fetchall_dict(db, options):
+    c = db.default
+    def op():
+        c.fetchall_dict("select * from pets where age=%s", 3)
+    return op
+
+
+@bench('queryset_rows')
+def bench_queryset_rows(db, options):
+    qs = db.default.pets.filter(age=3)
+    def op():
+        qs.clone().flush()
+    return op
+
+
+@bench('queryset_records')
+def bench_queryset_records(db, options):
+    if not hasattr(QuerySet, 'records'):
+        raise Skip('no Record rows')
+    qs = db.default.pets.filter(age=3).records()
+    def op():
+        qs.clone().flush()
+    return op
+
+
+@bench('pool_checkout', threaded=True)
+def bench_pool_checkout(db, options):
+    db = make_hub(options, latency=options.latency, rows=1)
+    def op():
+        db.default.fetchone("select 1")
+    op.db = db
+    return op
+
+
+@bench('pool_transaction', threaded=True)
+def bench_pool_transaction(db, options):
+    db = make_hub(options, latency=options.latency, rows=1)
+    def op():
+        with db.default as c:
+            c.fetchone("select 1")
+            c.execute("update pets set age=age+1 where id=%s", 1)
+    op.db = db
+    return op
+
+
+def run(options):
+    results = {}
+    db = make_hub(options)
+    for name, threaded, f in BENCHMARKS:
+        if options.k and options.k not in name:
+            continue
+        threads = options.threads if threaded else 1
+        batch = 1 if threaded else 100
+        try:
+            op = f(db, options)
+            # warm up caches and pools
+            measure(op, min(0.1, options.duration), threads, batch)
+            ops, elapsed, lat = measure(op, options.duration, threads, batch)
+        except Skip as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        except Exception as e:
+            results[name] = {'error': '%s: %s' % (type(e).__name__, e)}
+            continue
+        r = {
+            'threads': threads,
+            'ops': ops,
+            'ops_per_sec': ops / elapsed,
+            'us_per_op': elapsed * threads / ops * 1e6 if ops else None,
+            'p50_us': percentile(lat, 0.5) * 1e6,
+            'p99_us': percentile(lat, 0.99) * 1e6,
+        }
+        hub = getattr(op, 'db', None)
+        if hub is not None and hasattr(hub.pool_manager, 'stats'):
+            stats = list(hub.pool_manager.stats().values())[0]
+            r['pool'] = dict((k, stats[k]) for k in ('checkouts', 'created', 'timeouts',
+                                                      'exhausted', 'wait_avg', 'wait_max'))
+        results[name] = r
+    return {
+        'lorm': lorm.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'options': dict((k, v) for k, v in vars(options).items() if k not in ('json', 'compare')),
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    "print throughput changes, returns names of regressions"
+    regressions = []
+    print()
+    print('%-20s %14s %14s %9s' % ('benchmark', 'baseline/s', 'current/s', 'change'))
+    for name, r in sorted(report['results'].items()):
+        b = baseline['results'].get(name)
+        if 'ops_per_sec' not in r:
+            print('%-20s %14s %14s %9s' % (name, '-', '-', 'skipped' if 'skipped' in r else 'error'))
+            continue
+        if not b or 'ops_per_sec' not in b:
+            print('%-20s %14s %14.0f %9s' % (name, '-', r['ops_per_sec'], 'new'))
+            continue
+        change = r['ops_per_sec'] / b['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = ' !'
+            regressions.append(name)
+        print('%-20s %14.0f %14.0f %+8.1f%%%s' % (name, b['ops_per_sec'], r['ops_per_sec'],
+                                                  change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='lorm benchmarks')
+    parser.add_argument('-k', help='only benchmarks whose name contains this')
+    parser.add_argument('--duration', type=float, default=1.0, help='seconds per benchmark')
+    parser.add_argument('--threads', type=int, default=16, help='threads of threaded benchmarks')
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--pool-class', default='queue', help='queue or lifo')
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='seconds per statement of threaded benchmarks')
+    parser.add_argument('--rows', type=int, default=100, help='rows per select')
+    parser.add_argument('--columns', type=int, default=8, help='columns per row')
+    parser.add_argument('--json', help='write results to this file, - for stdout')
+    parser.add_argument('--compare', help='baseline results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='throughput loss reported as a regression (default 0.1)')
+    options = parser.parse_args(argv)
+    if options.pool_class != 'queue' and not hasattr(mysql_pool, 'LifoPool'):
+        parser.error('--pool-class is not supported by this lorm')
+
+    report = run(options)
+    if options.json == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        if options.json:
+            with open(options.json, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        print('%-20s %8s %14s %10s %10s %10s' % ('benchmark', 'threads', 'ops/s',
+                                                'us/op', 'p50 us', 'p99 us'))
+        for name, r in sorted(report['results'].items()):
+            if 'ops_per_sec' not in r:
+                print('%-20s %8s %s' % (name, '-', r.get('skipped') and 'skipped: ' + r['skipped']
+                                        or 'error: ' + r['error']))
+                continue
+            print('%-20s %8d %14.0f %10.2f %10.2f %10.2f' % (
+                name, r['threads'], r['ops_per_sec'], r['us_per_op'] or 0, r['p50_us'], r['p99_us']))
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,6 +12,31 @@ if __name__ == '__main__':
     db.add_pool('default', host='127.0.0.1', port=3306, user='root',
                 passwd='', db='test', charset='utf8', autocommit=True,
                 pool_size=8, wait_timeout=30)
+    # pool maintenance: 2 connections opened now and kept warm,
+    # connections idle longer than 5 seconds are pinged every 10 seconds
+    # db.add_pool('warm', host='127.0.0.1', port=3306, user='root',
+    #             passwd='', db='test', charset='utf8', autocommit=True,
+    #             pool_size=8, wait_timeout=30, min_idle=2, ping_after=5,
+    #             maintain_interval=10)
+
+    # LIFO pool: the last returned connection is reused first, spare ones age out
+    # db.add_pool('lifo', host='127.0.0.1', port=3306, user='root', passwd='', db='test',
+    #             pool_size=8, wait_timeout=30, pool_class='lifo', affinity=True)
+
+    # read/write splitting: reads go to the replicas, writes and transactions
+    # to the primary, reads stay on the primary for 1 second after a write
+    # db.add_pool('rw', host='master', port=3306, user='root', passwd='', db='test',
+    #             autocommit=True, pool_size=8, wait_timeout=30,
+    #             replicas=[{'host': 'replica1'}, {'host': 'replica2'}],
+    #             read_policy='least_in_use', read_your_writes=1)
+
+    # log statements slower than 0.5s, 10% of them
+    # from lorm import SlowQueryLog
+    # db.add_hook(SlowQueryLog(threshold=0.5, sample=0.1))
+    # warn on full scans, filesorts and temporary tables, once per query shape
+    # from lorm import ExplainSampler
+    # db.add_hook(ExplainSampler(sample=0.01, min_rows=10000))
+    # print db.default.pet.filter(name__contains='a').explain()
 
     # pet = db.default.pet.get(id=1)
     # print pet
@@ -52,13 +77,51 @@ if __name__ == '__main__':
     # print db.default.pet.filter(id__lt=10).flat('id')[:]
     # >>> [1, 2, 3]
 
+    # streaming, rows are fetched through a server-side cursor
+    # for pet in db.default.pet.filter(id__lt=10000).iterator(batch=1000):
+    #     print pet.id
+
+    # keyset pagination, pages by `id > last_seen` instead of an offset
+    # for pets in db.default.pet.filter(name__startswith=u'a').chunked_by('id', size=5000):
+    #     print len(pets)
+
+    # row style: compact records, tuples sharing one field index
+    # rows = db.default.pet.filter(id__lt=10).records('id', 'name')[:]
+    # print rows[0].name, rows[0]['name'], rows[0][1]
+    # >>> cat cat cat
+
+    # column oriented result, numeric columns are packed into array.array
+    # print db.default.pet.filter(id__lt=4).columns('id', 'name')
+    # >>> {'id': array('q', [1, 2, 3]), 'name': [u'cat', u'dog', u'bird']}
+    # for cols in db.default.pet.iter_columns('id', batch=10000, numpy=True):
+    #     print cols.id.sum()
+
+    # cache results for 30 seconds, writes to the table through this hub invalidate them
+    # print db.default.pet.cache(ttl=30).get(id=1)
+    # print db.result_cache.stats()
+
+    # load rows by ids, returns {id: row}
+    # print db.default.pet.in_bulk([1, 2, 2, 3])
+    # coalesce lookups from many threads into one query
+    # pets = db.default.pet.loader(key='id', window=0.002)
+    # print pets.load(1)
+
     # count
     # print db.default.pet.count()
     # >>> 979
+    # estimated by EXPLAIN, no scan on huge tables
+    # print db.default.pet.filter(name='cat').count(estimate=True)
 
     # sum
     # print db.default.pet.flat("sum(id)").first()
 
+    # aggregates, computed by the server
+    # from lorm import Sum, Max, Count
+    # print db.default.pet.aggregate(total=Sum('id'), top=Max('id'))
+    # >>> {'top': 979, 'total': 479710}
+    # for r in db.default.pet.group_by('name').annotate(n=Count('*')).order_by('-n')[:10]:
+    #     print r.name, r.n
+
     # like 'xxx%'
     # print db.default.pet.filter(name__startswith=u'熊').select('id')[:]
     # >>> {u'id': 1}
@@ -109,6 +172,34 @@ if __name__ == '__main__':
     # print db.default.pet.bulk_create(items)
     # >>> 2
 
+    # bulk update, different values per row in one statement
+    # rows = [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}]
+    # print db.default.pet.bulk_update(rows, key='id', fields=['name'])
+    # >>> 2
+
+    # bulk load with LOAD DATA LOCAL INFILE, needs local_infile=True in add_pool
+    # rows = ((i, 'pet%d' % i) for i in range(100000))
+    # print db.default.pet.load(rows, columns=['id', 'name'], mode='ignore')
+    # >>> 100000
+
+    # independent queries concurrently, each on a pooled connection of its own
+    # cats, total = db.gather(db.default.pet.filter(name='cat'), "select count(*) from pet")
+    # f = db.submit("select * from pet where id=%s", 1, alias='default')
+    # print f.result()
+
+    # several statements in one round trip, needs client_flag=65536 in add_pool
+    # with db.default.batch() as b:
+    #     cats = b.add(db.default.pet.filter(name='cat'))
+    #     total = b.add("select count(*) from pet")
+    # print cats.result, total.get()
+
+    # shards, routed by user_id, scattered to every shard without it
+    # db.add_pool('users0', host='db0', ...)
+    # db.add_pool('users1', host='db1', ...)
+    # db.add_shards('users', ['users0', 'users1'], key='user_id')
+    # print db.users.orders.filter(user_id=7).count()
+    # print db.users.orders.order_by('-created')[:10]
+
     # check if exists
     # print db.default.pet.filter(id=1).exists()
 
@@ -0,0 +1,559 @@
+# coding: utf-8
+"""
+asyncio counterpart of Hub, ConnectionProxy and QueuePool (Python 3.6+).
+
+Works with any async DB-API style driver whose connect/cursor/execute/fetch*
+methods are coroutines or plain functions, such as aiomysql.
+
+>>> import aiomysql
+>>> from lorm.aio import AsyncHub
+>>> db = AsyncHub(aiomysql)
+>>> db.add_pool('default', host='localhost', port=3306, user='root',
+                password='root', db='test', autocommit=True, pool_size=8, wait_timeout=30)
+>>> await db.default.pets.filter(id__lt=10).all()
+>>> async for pet in db.default.pets.iterator():
+>>>     print(pet.name)
+>>> async with db.default as c:
+>>>     await c.pets.create(name='fish')
+"""
+import asyncio
+import inspect
+import logging
+import time
+
+from .db import QuerySet, Struct, explain_estimate
+from .mysql_pool import TimeoutError
+
+
+async def maybe_await(x):
+    if inspect.isawaitable(x):
+        return await x
+    return x
+
+
+def is_broken(conn, e):
+    "connection broken or lost"
+    error = getattr(conn._driver, 'Error', None)
+    return error is not None and isinstance(e, error) and e.args and e.args[0] in (2006, 2013)
+
+
+class AsyncQueuePool:
+    def __init__(self, creator, pool_size=5, timeout=2.0, recycle=None):
+        """
+        :param creator: coroutine function, returns a connection
+        :param pool_size: max connections kept by the pool
+        :param timeout: seconds to wait for a free connection when the pool is exhausted
+        :param recycle: seconds a connection may stay idle, less than mysql's wait_timeout
+        """
+        self.creator = creator
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pool_size = pool_size
+        self._q = None
+        self.overflow = -pool_size
+
+    @property
+    def q(self):
+        # created lazily, asyncio.Queue binds the running loop before Python 3.10
+        if self._q is None:
+            self._q = asyncio.Queue(self.pool_size)
+        return self._q
+
+    async def create_connection(self):
+        c = await self.creator()
+        c._pool = self
+        c._activetime = time.time()
+        c._lock = asyncio.Lock()
+        return c
+
+    async def close(self, conn):
+        if getattr(conn, '_pool', None) is not self:
+            return
+        del conn._pool
+        try:
+            await maybe_await(conn.close())
+        except Exception:
+            pass
+        finally:
+            self.overflow -= 1
+
+    async def connect(self):
+        while 1:
+            try:
+                c = self.q.get_nowait()
+            except asyncio.QueueEmpty:
+                if self.overflow < 0:
+                    self.overflow += 1
+                    try:
+                        return await self.create_connection()
+                    except BaseException:
+                        self.overflow -= 1
+                        raise
+                try:
+                    c = await asyncio.wait_for(self.q.get(), self.timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(
+                        "AsyncQueuePool limit of size %d, "
+                        "connection timed out, timeout %d" %
+                        (self.size(), self.timeout))
+            if self.recycle is not None and time.time() - c._activetime >= self.recycle:
+                await self.close(c)
+                continue
+            return c
+
+    async def return_conn(self, conn):
+        if getattr(conn, '_pool', None) is not self:
+            return
+        if self.recycle is not None and time.time() - conn._activetime >= self.recycle:
+            await self.close(conn)
+            return
+        try:
+            self.q.put_nowait(conn)
+        except asyncio.QueueFull:
+            logging.warning('AsyncQueuePool Full: %s' % self.q.qsize())
+            await self.close(conn)
+
+    def size(self):
+        return self.pool_size
+
+    def len(self):
+        return self.q.qsize()
+
+    async def clear(self):
+        while 1:
+            try:
+                c = self.q.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            await self.close(c)
+
+
+class AsyncExecuter:
+    def __init__(self, proxy, cursorclass=None):
+        self.p = proxy
+        self.cursorclass = cursorclass
+        self.c = None
+        self.cursor = None
+
+    async def __aenter__(self):
+        self.c = await self.p.connect()
+        if self.p.streaming and self.c is self.p.c:
+            raise RuntimeError('The connection is streaming rows of iterate()/iterator(), '
+                               'exhaust or close it before running other statements.')
+        await self.c._lock.acquire()
+        try:
+            if self.cursorclass is None:
+                self.cursor = await maybe_await(self.c.cursor())
+            else:
+                self.cursor = await maybe_await(self.c.cursor(self.cursorclass))
+        except BaseException:
+            self.c._lock.release()
+            raise
+        self.c._activetime = time.time()
+        return self.cursor
+
+    async def __aexit__(self, exc, value, tb):
+        self.p.last_executed = getattr(self.cursor, '_last_executed', None)
+        try:
+            await maybe_await(self.cursor.close())
+        finally:
+            self.c._lock.release()
+            if value is not None and is_broken(self.c, value):
+                self.p.c = None
+                await self.p.pool.close(self.c)
+            elif not self.p.transacting and await maybe_await(self.c.get_autocommit()):
+                await self.p.close()
+
+
+class AsyncConnectionProxy:
+    def __init__(self, pool):
+        self.pool = pool
+        self.c = None
+        self.transacting = False
+        self.streaming = False
+        self.last_executed = None
+
+    async def connect(self):
+        if self.c:
+            return self.c
+        self.c = await self.pool.connect()
+        return self.c
+
+    async def close(self):
+        if self.c:
+            c, self.c = self.c, None
+            await self.pool.return_conn(c)
+
+    def fork(self):
+        "a new proxy on the same pool, without sharing the connection"
+        return AsyncConnectionProxy(self.pool)
+
+    async def begin(self):
+        await self.execute(u'BEGIN')
+
+    async def commit(self):
+        assert self.c, 'Need connect before commit!'
+        await maybe_await(self.c.commit())
+
+    async def rollback(self):
+        assert self.c, 'Need connect before rollback!'
+        await maybe_await(self.c.rollback())
+
+    async def fetchall(self, sql, *args):
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            await maybe_await(cursor.execute(sql, args))
+            rows = await maybe_await(cursor.fetchall())
+        return rows
+
+    async def fetchone(self, sql, *args):
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            await maybe_await(cursor.execute(sql, args))
+            row = await maybe_await(cursor.fetchone())
+        return row
+
+    async def fetchall_fields(self, sql, *args):
+        """
+        Returns field names and result rows.
+        """
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            await maybe_await(cursor.execute(sql, args))
+            fields = [r[0] for r in cursor.description]
+            rows = await maybe_await(cursor.fetchall())
+        return fields, rows
+
+    async def fetchall_dict(self, sql, *args):
+        fields, rows = await self.fetchall_fields(sql, *args)
+        return [Struct(zip(fields, row)) for row in rows]
+
+    async def fetchone_dict(self, sql, *args):
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            await maybe_await(cursor.execute(sql, args))
+            row = await maybe_await(cursor.fetchone())
+        if not row:
+            return
+        fields = [r[0] for r in cursor.description]
+        return Struct(zip(fields, row))
+
+    async def iterate(self, sql, args=None, batch=1000):
+        """
+        Execute a query on an unbuffered server-side cursor, yields
+        (fields, rows) with at most `batch` rows each time.
+        Out of a transaction, a private connection is used. In a transaction
+        the rows stream on the transaction's connection, which can't run
+        other statements until then (RuntimeError).
+        """
+        args = args or None
+        proxy = self if self.c else self.fork()
+        try:
+            conn = await proxy.connect()
+            cursorclass = getattr(conn._driver, 'SSCursor', None)
+            async with AsyncExecuter(proxy, cursorclass) as cursor:
+                await maybe_await(cursor.execute(sql, args))
+                proxy.streaming = True
+                fields = [r[0] for r in cursor.description]
+                while 1:
+                    rows = await maybe_await(cursor.fetchmany(batch))
+                    if not rows:
+                        break
+                    yield fields, rows
+        finally:
+            proxy.streaming = False
+            if proxy is not self:
+                self.last_executed = proxy.last_executed
+                await proxy.close()
+
+    async def execute(self, sql, *args):
+        """
+        Returns affected rows and lastrowid.
+        """
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            await maybe_await(cursor.execute(sql, args))
+        return cursor.rowcount, cursor.lastrowid
+
+    async def execute_many(self, sql, args=None):
+        """
+        Execute a multi-row query. Returns affected rows.
+        """
+        args = args or None
+        async with AsyncExecuter(self) as cursor:
+            rows = await maybe_await(cursor.executemany(sql, args))
+        return rows
+
+    async def __aenter__(self):
+        """Begin a transaction"""
+        self.transacting = True
+        c = await self.connect()
+        if await maybe_await(c.get_autocommit()):
+            await self.begin()
+        return self
+
+    async def __aexit__(self, exc, value, tb):
+        """End a transaction"""
+        try:
+            if exc:
+                await self.rollback()
+            else:
+                await self.commit()
+        finally:
+            self.transacting = False
+            await self.close()
+
+    def __getattr__(self, table_name):
+        if table_name.startswith('__'):
+            raise AttributeError(table_name)
+        return AsyncQuerySet(self, table_name)
+
+    def __getitem__(self, table_name):
+        return AsyncQuerySet(self, table_name)
+
+    def __str__(self):
+        return "<AsyncConnectionProxy: %x>" % (id(self))
+
+
+class AsyncQuerySet(QuerySet):
+    """
+    QuerySet whose terminal methods are coroutines:
+    all, get, first, last, count, exists, aggregate, explain, columns,
+    in_bulk, create, bulk_create, bulk_update, update, delete, and
+    `await qs[a:b]`. Rows are streamed by `async for row in qs`, also
+    iterator(), chunked_by() and iter_columns() are async generators.
+    """
+
+    async def all(self):
+        if self._result:
+            return self._result
+        sql, args = self.make_query()
+        fields, rows = await self.conn.fetchall_fields(sql, *args)
+        self._result = self.make_rows(fields, rows)
+        return self._result
+
+    async def iterator(self, batch=1000):
+        sql, args = self.make_query()
+        rows_iter = self.conn.iterate(sql, args, batch)
+        try:
+            async for fields, rows in rows_iter:
+                for row in self.make_rows(fields, rows):
+                    yield row
+        finally:
+            await rows_iter.aclose()
+
+    def __aiter__(self):
+        return self.iterator()
+
+    async def columns(self, *fields, **kw):
+        as_numpy = kw.get('numpy', False)
+        sql, args = self.make_query(select_list=fields or None)
+        names, rows = await self.conn.fetchall_fields(sql, *args)
+        return self.make_columns(names, rows, as_numpy)
+
+    async def iter_columns(self, *fields, **kw):
+        batch = kw.get('batch', 1000)
+        as_numpy = kw.get('numpy', False)
+        sql, args = self.make_query(select_list=fields or None)
+        rows_iter = self.conn.iterate(sql, args, batch)
+        try:
+            async for names, rows in rows_iter:
+                yield self.make_columns(names, rows, as_numpy)
+        finally:
+            await rows_iter.aclose()
+
+    async def chunked_by(self, *keys, **kw):
+        size = kw.get('size', 1000)
+        keys = keys or [f for f in self.order_list if f != u'?'] or [u'id']
+        last = None
+        while 1:
+            sql, vals = self.make_chunk(keys, last, size)
+            fields, rows = await self.conn.fetchall_fields(sql, *vals)
+            if not rows:
+                break
+            last, page = self.chunk_rows(keys, fields, rows)
+            yield page
+            if len(rows) < size:
+                break
+
+    async def in_bulk(self, ids, key='id', chunk=1000):
+        result = {}
+        for sql, vals in self.make_in_bulk(ids, key, chunk):
+            fields, rows = await self.conn.fetchall_fields(sql, *vals)
+            result.update(self.in_bulk_rows(key, fields, rows))
+        return result
+
+    async def get(self, *args, **kw):
+        sql, vals = self.make_get(*args, **kw)
+        fields, rows = await self.conn.fetchall_fields(sql, *vals)
+        rows = self.make_rows(fields, rows)
+        return rows[0] if rows else None
+
+    async def first(self):
+        return await self[0]
+
+    async def last(self):
+        return await self[-1]
+
+    async def aggregate(self, **aggregates):
+        sql, vals = self.make_aggregate(**aggregates)
+        fields, rows = await self.conn.fetchall_fields(sql, *vals)
+        return Struct(zip(fields, rows[0])) if rows else Struct()
+
+    async def explain(self):
+        sql, vals = self.make_query()
+        return await self.conn.fetchall_dict(u"explain " + sql, *vals)
+
+    async def count(self, estimate=False):
+        if self._result is not None:
+            return len(self._result)
+        if estimate:
+            sql, vals = self.make_estimate()
+            key = (id(self.conn.pool), sql, repr(vals))
+            n = self.estimate_cache.get(key)
+            if n is None:
+                n = explain_estimate(await self.conn.fetchall_dict(sql, *vals))
+                self.estimate_cache.set(key, n)
+            return n
+        sql, vals = self.make_count()
+        row = await self.conn.fetchone(sql, *vals)
+        return row[0] if row else 0
+
+    async def exists(self):
+        if self._result is not None:
+            return True
+        sql, vals = self.make_exists()
+        row = await self.conn.fetchone(sql, *vals)
+        return bool(row)
+
+    async def create(self, ignore=False, **kw):
+        "Returns lastrowid"
+        sql, values = self.make_create(ignore, **kw)
+        _, lastid = await self.conn.execute(sql, *values)
+        return lastid
+
+    async def bulk_create(self, obj_list, ignore=False, max_packet=None, batch_size=None):
+        "Returns affectrows"
+        if not obj_list:
+            return
+        affected_rows = 0
+        for sql, vals in self.make_bulk_create(obj_list, ignore, max_packet, batch_size):
+            n, _ = await self.conn.execute(sql, *vals)
+            affected_rows += n
+        return affected_rows
+
+    async def bulk_update(self, rows, key='id', fields=None, batch_size=1000, max_packet=None, ondup=False):
+        "Returns affectrows"
+        if not rows:
+            return 0
+        affected_rows = 0
+        for sql, vals in self.make_bulk_update(rows, key, fields, batch_size, max_packet, ondup):
+            n, _ = await self.conn.execute(sql, *vals)
+            affected_rows += n
+        return affected_rows
+
+    async def update(self, *args, **kw):
+        "return affected rows"
+        if not args and not kw:
+            return 0
+        sql, vals = self.make_update(*args, **kw)
+        n, _ = await self.conn.execute(sql, *vals)
+        return n
+
+    async def delete(self, *names):
+        "return affected rows"
+        sql, vals = self.make_delete(*names)
+        n, _ = await self.conn.execute(sql, *vals)
+        return n
+
+    async def _getitem(self, k):
+        if self._result is not None:
+            return self._result.__getitem__(k)
+        q = self.clone()
+        if isinstance(k, int):
+            if k < 0:
+                k = -k - 1
+                q.reverse_order_list()
+            q.limits = [k, k+1]
+            rows = await q.all()
+            return rows[0] if rows else None
+        start = None if k.start is None else int(k.start)
+        stop = None if k.stop is None else int(k.stop)
+        assert k.step is None, 'Slice step is not supported.'
+        q.limits = [start, stop]
+        return await q.all()
+
+    def __getitem__(self, k):
+        return self._getitem(k)
+
+    def flush(self):
+        raise TypeError('Use `await qs.all()` on an AsyncQuerySet.')
+
+    def cache(self, ttl=60):
+        raise TypeError('The result cache is not supported on an AsyncQuerySet.')
+
+    def load(self, *args, **kw):
+        raise TypeError('Use `await qs.bulk_create()` on an AsyncQuerySet.')
+
+    def loader(self, *args, **kw):
+        raise TypeError('BatchLoader is thread based, use `await qs.in_bulk()` on an AsyncQuerySet.')
+
+    def __iter__(self):
+        raise TypeError('Use `async for` on an AsyncQuerySet.')
+
+    def __len__(self):
+        raise TypeError('Use `await qs.count()` on an AsyncQuerySet.')
+
+    def __bool__(self):
+        raise TypeError('Use `await qs.exists()` on an AsyncQuerySet.')
+
+
+class AsyncHub:
+    """
+    Usage:
+
+    >>> db = AsyncHub(aiomysql)
+    >>> db.add_pool('default', host='', port=3306, user='', password='', db='',
+                    autocommit=True, pool_size=8, wait_timeout=30)
+    >>> await db.default.auth_user.get(id=1)
+
+    :param driver: an async driver module, such as aiomysql
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.pools = {}
+        self.aliases = {}
+
+    def add_pool(self, alias, **connect_kwargs):
+        """
+        :param pool_size: (optional)Connection pool capacity
+        :param wait_timeout: (optional)Maximum retention time (SEC)
+        :param timeout: (optional)Seconds to wait for a free connection
+        """
+        pool_size = connect_kwargs.pop('pool_size', 8)
+        recycle = connect_kwargs.pop('wait_timeout', 30)
+        timeout = connect_kwargs.pop('timeout', 2.0)
+
+        async def creator():
+            c = await maybe_await(self.driver.connect(**connect_kwargs))
+            c._driver = self.driver
+            return c
+
+        key = tuple(connect_kwargs.get(k) for k in ('host', 'port', 'user', 'db'))
+        if key not in self.pools:
+            self.pools[key] = AsyncQueuePool(creator, pool_size=pool_size, timeout=timeout, recycle=recycle)
+        self.aliases[alias] = self.pools[key]
+
+    def get_proxy(self, alias):
+        pool = self.aliases.get(alias)
+        if pool:
+            return AsyncConnectionProxy(pool)
+
+    def __getattr__(self, alias):
+        return self.get_proxy(alias)
+
+    def __getitem__(self, alias):
+        return self.get_proxy(alias)
+
+    def __str__(self):
+        return "<AsyncHub: {}>".format(id(self))
@@ -0,0 +1,146 @@
+# coding: utf-8
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with hit/miss counters.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set('a', 1)
+    >>> cache.get('a')
+    >>> 1
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / total if total else 0.0,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TTLCache(LRUCache):
+    """
+    LRU cache whose entries expire after `ttl` seconds.
+
+    The default backend of ResultCache. Any object with get(key),
+    set(key, value, ttl) and optionally stats() can be a backend.
+    """
+    def __init__(self, maxsize=10000, ttl=60):
+        LRUCache.__init__(self, maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = LRUCache.get(self, key)
+        if entry is None:
+            return default
+        expire, value = entry
+        if expire < time.time():
+            with self._lock:
+                # expired, count as a miss
+                self.hits -= 1
+                self.misses += 1
+                self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        LRUCache.set(self, key, (time.time() + ttl, value))
+
+
+class ResultCache:
+    """
+    Query results cache of a Hub, with table-level invalidation.
+
+    Keys carry a version of their table; invalidating a table replaces the
+    version, so stale entries are never read again and age out of the
+    backend. Versions of a given backend are kept in it under
+    ('version', alias, table), so processes sharing the backend see each
+    other's invalidations. The default backend keeps them in this process.
+    """
+    # versions outlive any result, an expired one starts a new namespace
+    version_ttl = 86400
+
+    def __init__(self, backend=None):
+        if backend is None:
+            self.backend = TTLCache()
+            # apart from results, so lookups don't count in stats()
+            self.versions = TTLCache(ttl=self.version_ttl)
+        else:
+            self.backend = self.versions = backend
+
+    def version(self, alias, table):
+        key = (u'version', alias, table)
+        version = self.versions.get(key)
+        if version is None:
+            version = self.bump(key)
+        return version
+
+    def bump(self, key):
+        # a random value rather than an increment, so racing writers
+        # can't set a version back
+        version = random.getrandbits(64)
+        self.versions.set(key, version, self.version_ttl)
+        return version
+
+    def make_key(self, alias, table, sql, args):
+        return (alias, table, self.version(alias, table), sql, repr(args))
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl):
+        self.backend.set(key, value, ttl)
+
+    def invalidate(self, alias, table):
+        self.bump((u'version', alias, table))
+
+    def stats(self):
+        stats = getattr(self.backend, 'stats', None)
+        return stats() if stats else {}
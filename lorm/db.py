@@ -1,24 +1,54 @@
 #coding: utf-8
 import sys
+import os
+import re
+import errno
 import datetime
 import time
 import copy
 import sys
 import logging
+import tempfile
 import threading
+import array
+import random
+import itertools
+import zlib
+from collections import OrderedDict
 
 from . import mysql_pool
+from .cache import LRUCache, TTLCache, ResultCache
 
 py3k = sys.version_info.major > 2
 
 if py3k:
     IntType = int
+    TextType = str
+    StringTypes = (str, bytes)
+    ArrayIntTypes = (int,)
+    ArrayIntCode = 'q'
 else:
     IntType = (int, long)
+    TextType = unicode
+    StringTypes = (str, unicode)
+    ArrayIntTypes = (int, long)
+    ArrayIntCode = 'l'
 
 
 __all__ = [
     'Struct',
+    'Record',
+    'BulkError',
+    'QueryPlanError',
+    'QueryHook',
+    'SlowQueryLog',
+    'ExplainSampler',
+    'BatchLoader',
+    'Sum',
+    'Max',
+    'Min',
+    'Avg',
+    'Count',
     'ConnectionProxy',
     'Hub',
 ]
@@ -60,46 +90,620 @@ class Struct(dict):
         return Struct(dict.copy(self))
 
 
+class Record(tuple):
+    """
+    Compact row, a tuple which shares one field index with the other rows
+    of a result. Supports attribute and key access like Struct.
+
+    >>> Pet = record_class(('id', 'name'))
+    >>> o = Pet((1, 'cat'))
+    >>> o.name, o['name'], o[1]
+    >>> ('cat', 'cat', 'cat')
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        i = self._index.get(name)
+        if i is None:
+            return None
+        return tuple.__getitem__(self, i)
+
+    def __getitem__(self, k):
+        if isinstance(k, StringTypes):
+            return tuple.__getitem__(self, self._index[k])
+        return tuple.__getitem__(self, k)
+
+    def __reduce__(self):
+        return make_record, (self._fields, tuple(self))
+
+    def __repr__(self):
+        return u"Record({})".format(u', '.join(
+            u"{}={!r}".format(f, v) for f, v in zip(self._fields, self)))
+
+    def get(self, name, default=None):
+        i = self._index.get(name)
+        if i is None:
+            return default
+        return tuple.__getitem__(self, i)
+
+    def keys(self):
+        return list(self._fields)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def as_dict(self):
+        return Struct(zip(self._fields, self))
+
+
+_record_classes = LRUCache(256)
+
+def record_class(fields):
+    "returns the Record subclass shared by rows of these fields"
+    fields = tuple(fields)
+    cls = _record_classes.get(fields)
+    if cls is None:
+        index = dict((f, i) for i, f in enumerate(fields))
+        cls = type('Record', (Record,), {'__slots__': (), '_fields': fields, '_index': index})
+        _record_classes.set(fields, cls)
+    return cls
+
+def make_record(fields, values):
+    return record_class(fields)(values)
+
+
+def make_column(values, as_numpy=False):
+    """
+    Pack a column into array.array when it holds only integers or floats,
+    else a list. With as_numpy, returns a numpy array instead.
+    """
+    arr = None
+    if values:
+        t = type(values[0])
+        typecode = None
+        if t is float:
+            typecode = 'd'
+        elif t in ArrayIntTypes:
+            typecode = ArrayIntCode
+        if typecode:
+            try:
+                arr = array.array(typecode, values)
+            except (TypeError, OverflowError):
+                # NULLs, mixed types or out of range
+                arr = None
+    if as_numpy:
+        import numpy
+        if arr is not None:
+            return numpy.frombuffer(arr, dtype=arr.typecode)
+        return numpy.array(values, dtype=object)
+    if arr is not None:
+        return arr
+    return list(values)
+
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*)?$')
+
+def quote_name(name):
+    "backquote a field or table.field, expressions are kept as is"
+    if not IDENTIFIER.match(name):
+        return name
+    return u'.'.join(u"`{}`".format(s) for s in name.split(u'.'))
+
+
+class Aggregate:
+    """
+    Aggregate function of QuerySet.aggregate and annotate.
+
+    >>> Sum('amount'), Count('*'), Count('user_id', distinct=True)
+    """
+    function = None
+
+    def __init__(self, field, distinct=False):
+        self.field = field
+        self.distinct = distinct
+
+    def as_sql(self, alias):
+        field = quote_name(self.field) if self.field != u'*' else u'*'
+        distinct = u'distinct ' if self.distinct else u''
+        return u"{}({}{}) {}".format(self.function, distinct, field, quote_name(alias))
+
+
+class Sum(Aggregate):
+    function = u'sum'
+
+
+class Max(Aggregate):
+    function = u'max'
+
+
+class Min(Aggregate):
+    function = u'min'
+
+
+class Avg(Aggregate):
+    function = u'avg'
+
+
+class Count(Aggregate):
+    function = u'count'
+
+
+class BulkError(Exception):
+    """
+    Some batches of a parallel bulk_create failed.
+    `results` holds affected rows or the exception of every batch, in order.
+    """
+    def __init__(self, results):
+        self.results = results
+        self.affected_rows = sum(r for r in results if not isinstance(r, Exception))
+        errors = [r for r in results if isinstance(r, Exception)]
+        Exception.__init__(self, "%d of %d batches failed, first error: %r" %
+                           (len(errors), len(results), errors[0]))
+
+
+class QueryPlanError(Exception):
+    """
+    ExplainSampler found a bad plan, `plan` holds the EXPLAIN rows.
+    """
+    def __init__(self, sql, plan, problems):
+        self.sql = sql
+        self.plan = plan
+        self.problems = problems
+        Exception.__init__(self, "%s: %s" % (u', '.join(problems), sql))
+
+
+class QueryHook:
+    """
+    Base class of execution hooks, see Hub.add_hook.
+
+    `ctx` is a Struct of alias, proxy, conn (the connection the statement runs on),
+    sql, args and wait (pool checkout time), after execution also elapsed,
+    rowcount and exc (None if succeeded).
+    """
+    def before_execute(self, ctx):
+        pass
+
+    def after_execute(self, ctx):
+        pass
+
+
+class SlowQueryLog(QueryHook):
+    """
+    Log statements slower than `threshold` seconds, a `sample` fraction of them.
+
+    >>> db.add_hook(SlowQueryLog(threshold=0.5, sample=0.1))
+    """
+    def __init__(self, threshold=1.0, sample=1.0, logger=None):
+        self.threshold = threshold
+        self.sample = sample
+        self.logger = logger or logging.getLogger('lorm.slow')
+
+    def after_execute(self, ctx):
+        if ctx.elapsed < self.threshold:
+            return
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        self.logger.warning('slow query %.3fs (wait %.3fs, rows %s) on %s: %s %r',
+                            ctx.elapsed, ctx.wait, ctx.rowcount, ctx.alias, ctx.sql, ctx.args)
+
+
+class ExplainSampler(QueryHook):
+    """
+    EXPLAIN a `sample` fraction of select/update/delete statements, once per
+    sql shape, on the statement's connection. Plans with full table scans,
+    filesorts or temporary tables over `min_rows` estimated rows are logged,
+    or with action='raise' fail the statement with QueryPlanError.
+
+    >>> db.add_hook(ExplainSampler(sample=0.01, min_rows=10000))
+    """
+    STATEMENTS = (u'select', u'update', u'delete')
+
+    def __init__(self, sample=1.0, min_rows=1000, action='warn', logger=None, maxsize=10000):
+        assert action in ('warn', 'raise'), 'Unknown action: %s' % action
+        self.sample = sample
+        self.min_rows = min_rows
+        self.action = action
+        self.logger = logger or logging.getLogger('lorm.explain')
+        # shapes already explained
+        self.seen = LRUCache(maxsize)
+
+    def before_execute(self, ctx):
+        sql = ctx.sql
+        if not isinstance(sql, StringTypes) or sql.lstrip()[:6].lower() not in self.STATEMENTS:
+            return
+        if u';' in sql:
+            # a multi-statement batch, EXPLAIN would run the rest of it
+            return
+        key = (ctx.alias, sql)
+        hit = self.seen.get(key)
+        if hit is not None:
+            # a bad shape keeps failing, it's logged only once
+            if hit and self.action == 'raise':
+                raise QueryPlanError(sql, hit[0], hit[1])
+            return
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        # the statement's cursor isn't open yet, no second connection is needed
+        conn = ctx.conn
+        args = ctx.args if isinstance(ctx.args, tuple) else None
+        try:
+            with conn._lock:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(u"explain " + sql, args)
+                    fields = [r[0] for r in cursor.description]
+                    plan = [Struct(zip(fields, row)) for row in cursor.fetchall()]
+                finally:
+                    cursor.close()
+        except Exception as e:
+            # not retried, the shape would fail every time
+            self.seen.set(key, ())
+            self.logger.debug('explain failed on %s: %s %r', ctx.alias, e, sql)
+            return
+        problems = self.check(plan)
+        self.seen.set(key, (plan, problems) if problems else ())
+        if not problems:
+            return
+        if self.action == 'raise':
+            raise QueryPlanError(sql, plan, problems)
+        self.logger.warning('bad plan (%s) on %s: %s %r',
+                            u', '.join(problems), ctx.alias, sql, ctx.args)
+
+    def check(self, plan):
+        "problems of EXPLAIN rows estimated to touch at least min_rows rows"
+        problems = []
+        for row in plan:
+            rows = row.get('rows') or 0
+            if rows < self.min_rows:
+                continue
+            table = row.get('table')
+            extra = row.get('Extra') or u''
+            if row.get('type') == u'ALL':
+                problems.append(u"full scan of %s (%d rows)" % (table, rows))
+            if u'Using filesort' in extra:
+                problems.append(u"filesort on %s (%d rows)" % (table, rows))
+            if u'Using temporary' in extra:
+                problems.append(u"temporary table on %s (%d rows)" % (table, rows))
+        return problems
+
+
 class Executer:
-    def __init__(self, proxy):
+    def __init__(self, proxy, sql=None, args=None, read=False, unbuffered=False):
         self.p = proxy
-        self.c = proxy.connect()
+        self.c = proxy.connect_read() if read else proxy.connect()
+        self.read = read
+        self.unbuffered = unbuffered
+        self.discard = False
         self.cursor = None
+        self.ctx = None
+        if proxy.hooks:
+            self.ctx = Struct(alias=proxy.alias, proxy=proxy, conn=self.c, sql=sql, args=args,
+                              wait=proxy.wait)
+            proxy.wait = 0.0
 
     def __enter__(self):
+        if self.p.streaming and self.c is self.p.c:
+            self.release()
+            raise RuntimeError('The connection is streaming rows of iterate()/iterator(), '
+                               'exhaust or close it before running other statements.')
+        if self.ctx is not None:
+            try:
+                for hook in self.p.hooks:
+                    hook.before_execute(self.ctx)
+            except:
+                self.release()
+                raise
+            self.start = time.time()
         self.c._lock.acquire()
-        self.cursor = self.c.cursor()
+        cursorclass = None
+        if self.unbuffered:
+            # server-side cursor of MySQLdb and pymysql
+            driver = getattr(self.c, '_driver', None)
+            cursorclass = getattr(getattr(driver, 'cursors', None), 'SSCursor', None)
+        if cursorclass is None:
+            self.cursor = self.c.cursor()
+        else:
+            self.cursor = self.c.cursor(cursorclass)
         return self.cursor
 
     def __exit__(self, exc, value, tb):
         self.p.last_executed = getattr(self.cursor, '_last_executed', None)
-        self.cursor.close()
+        rowcount = self.cursor.rowcount
+        if self.discard:
+            # closing an unbuffered cursor reads the rest of the result,
+            # the connection is closed through its pool instead
+            self.close_conn()
+        else:
+            self.cursor.close()
         self.c._lock.release()
-        if not self.p.transacting and self.p.get_autocommit():
+        if not self.read and self.p.replicas is not None:
+            self.p.replicas.mark_write()
+        self.release()
+        ctx = self.ctx
+        if ctx is not None:
+            ctx.elapsed = time.time() - self.start
+            ctx.rowcount = rowcount
+            ctx.exc = value
+            for hook in self.p.hooks:
+                hook.after_execute(ctx)
+
+    def close_conn(self):
+        pool = getattr(self.c, '_pool', None)
+        if pool is not None:
+            pool.close(self.c)
+        if self.c is self.p.c:
+            self.p.c = None
+
+    def release(self):
+        if self.c is self.p.c:
+            self.p.release()
+        else:
+            # replica connection, back to its pool
+            self.c.close()
+
+
+class ReplicaSet:
+    """
+    Read replicas of an alias, see Hub.add_pool.
+
+    :param pools: replica pools
+    :param policy: 'round_robin' or 'least_in_use'
+    :param read_your_writes: after a write, reads of the same thread
+                             go to the primary for this many seconds
+    """
+    POLICIES = ('round_robin', 'least_in_use')
+
+    def __init__(self, pools, policy='round_robin', read_your_writes=0):
+        assert policy in self.POLICIES, 'Unknown read policy: %s' % policy
+        self.pools = pools
+        self.policy = policy
+        self.read_your_writes = read_your_writes
+        self._counter = itertools.count()
+        self._local = threading.local()
+
+    def pick(self):
+        if self.policy == 'least_in_use':
+            return min(self.pools, key=lambda p: p.in_use())
+        return self.pools[next(self._counter) % len(self.pools)]
+
+    def connect(self):
+        return self.pick().connect()
+
+    def mark_write(self):
+        if self.read_your_writes:
+            self._local.last_write = time.time()
+
+    def in_write_window(self):
+        if not self.read_your_writes:
+            return False
+        t = getattr(self._local, 'last_write', None)
+        return t is not None and time.time() - t < self.read_your_writes
+
+
+class Session:
+    def __init__(self, proxy):
+        self.p = proxy
+        self.pinned = False
+
+    def __enter__(self):
+        self.pinned = self.p.pinned
+        self.p.pinned = True
+        return self.p
+
+    def __exit__(self, exc, value, tb):
+        # nested sessions keep the outer pin
+        self.p.pinned = self.pinned
+        if not self.pinned and not self.p.transacting:
             self.p.close()
 
 
+# CLIENT.MULTI_STATEMENTS of the connection's client_flag
+MULTI_STATEMENTS = 65536
+
+
+def format_sql(conn, sql, args):
+    "sql with args inlined as literals of the connection, as the driver does"
+    if not args:
+        return sql
+    vals = []
+    for a in args:
+        v = conn.literal(a)
+        if isinstance(v, bytes):
+            v = v.decode('utf8')
+        vals.append(v)
+    return sql % tuple(vals)
+
+
+class BatchResult:
+    """
+    A statement queued in ConnectionProxy.batch. When the batch exits,
+    `result` holds its rows (QuerySet rows for a QuerySet) or affected
+    rows of a statement without result set, or `error` its exception.
+    """
+    def __init__(self, sql, args, queryset=None):
+        self.sql = sql
+        self.args = args
+        self.queryset = queryset
+        self.result = None
+        self.error = None
+
+    def get(self):
+        "result, or raise the statement's error"
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def set_result(self, cursor):
+        if cursor.description is None:
+            self.result = cursor.rowcount
+            return
+        rows = cursor.fetchall()
+        if self.queryset is not None:
+            rows = self.queryset.make_rows([d[0] for d in cursor.description], rows)
+        self.result = rows
+
+
+class Batch:
+    def __init__(self, proxy):
+        self.p = proxy
+        self.items = []
+
+    def add(self, query, *args):
+        "queue a QuerySet or a raw statement, returns its BatchResult"
+        if isinstance(query, QuerySet):
+            sql, vals = query.make_query()
+            item = BatchResult(sql, tuple(vals), query)
+        else:
+            item = BatchResult(query, args)
+        self.items.append(item)
+        return item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, tb):
+        if exc is None:
+            self.run()
+
+    def run(self):
+        items, self.items = self.items, []
+        if not items:
+            return
+        p = self.p
+        with p.session():
+            c = p.connect()
+            read = all(i.sql.lstrip()[:6].lower() == u'select' for i in items)
+            if len(items) > 1 and getattr(c, 'client_flag', 0) & MULTI_STATEMENTS:
+                items = self.run_multi(c, items, read)
+            for item in items:
+                self.run_one(item, read)
+
+    def run_multi(self, c, items, read):
+        "one round trip, returns the statements skipped after a failed one"
+        sql = u';\n'.join(format_sql(c, i.sql, i.args) for i in items)
+        n = 0
+        try:
+            with Executer(self.p, sql, None, read) as cursor:
+                cursor.execute(sql)
+                while 1:
+                    items[n].set_result(cursor)
+                    n += 1
+                    # the server stops at a failed statement, raised here
+                    if n == len(items) or not cursor.nextset():
+                        break
+        except Exception as e:
+            if n == len(items):
+                raise
+            items[n].error = e
+            n += 1
+        return items[n:]
+
+    def run_one(self, item, read):
+        args = item.args or None
+        try:
+            with Executer(self.p, item.sql, args, read) as cursor:
+                cursor.execute(item.sql, args)
+                item.set_result(cursor)
+        except Exception as e:
+            item.error = e
+
+
 class ConnectionProxy:
-    def __init__(self, creator):
+    def __init__(self, creator, hooks=(), alias=None, replicas=None, cache=None):
         self.creator = creator
+        self.hooks = hooks
+        self.alias = alias
+        self.replicas = replicas
+        self.cache = cache
+        self.dirty_tables = set()
         self.c = None
         self.transacting = False
+        self.pinned = False
+        self.streaming = False
         self.last_executed = None
+        self.wait = 0.0
+
+    def checkout(self, creator):
+        if self.hooks:
+            t = time.time()
+            conn = creator()
+            self.wait = time.time() - t
+        else:
+            conn = creator()
+        conn._lock = threading.Lock()
+        return conn
 
     def connect(self):
         if self.c:
             return self.c
 
-        conn = self.creator()
-        conn._lock = threading.Lock()
+        conn = self.checkout(self.creator)
         self.c = conn
         return conn
 
+    def connect_read(self):
+        """
+        Connection for a read statement: a replica, unless there is none,
+        a transaction or session holds the primary connection (checked out
+        by its first statement), or a write was made within the
+        read-your-writes window.
+        """
+        if (self.replicas is None or self.c or self.pinned or self.transacting
+                or self.replicas.in_write_window()):
+            return self.connect()
+        return self.checkout(self.replicas.connect)
+
     def close(self):
         if self.c:
             self.c.close()
             self.c = None
 
+    def release(self):
+        "return the connection after a statement, unless a transaction or session holds it"
+        if not self.transacting and not self.pinned and self.get_autocommit():
+            self.close()
+
+    def session(self):
+        """
+        Pin one pooled connection for a unit of work without a transaction,
+        it is returned when the block exits.
+
+        >>> with db.default.session() as s:
+        >>>     s.pets.get(id=1)
+        >>>     s.pets.filter(id=1).update(name='cat')
+        """
+        return Session(self)
+
+    def batch(self):
+        """
+        Queue QuerySets and raw statements, and send them when the block exits:
+        in one round trip if the connection has CLIENT.MULTI_STATEMENTS
+        (client_flag=65536 in add_pool), otherwise one by one on one connection.
+        Each statement's result or error is on its handle, see BatchResult.
+
+        >>> with db.default.batch() as b:
+        >>>     pets = b.add(db.default.pets.filter(age=1))
+        >>>     n = b.add("select count(*) from users where id>%s", 10)
+        >>> pets.result, n.get()[0][0]
+        """
+        return Batch(self)
+
+    def fork(self):
+        "a new proxy on the same pool, without sharing the connection"
+        return ConnectionProxy(self.creator, self.hooks, self.alias, self.replicas, self.cache)
+
+    def invalidate(self, table_name):
+        "drop cached results of a table, again at the end of a transaction"
+        if self.cache is None:
+            return
+        self.cache.invalidate(self.alias, table_name)
+        if self.transacting:
+            self.dirty_tables.add(table_name)
+
     @property
     def open(self):
         """return if connection alive"""
@@ -139,29 +743,81 @@ class ConnectionProxy:
 
     def fetchall(self, sql, *args):
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args, read=True) as cursor:
             cursor.execute(sql, args)
             rows = cursor.fetchall()
         return rows
 
     def fetchone(self, sql, *args):
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args, read=True) as cursor:
             cursor.execute(sql, args)
             row = cursor.fetchone()
         return row
 
     def fetchall_dict(self, sql, *args):
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args, read=True) as cursor:
             cursor.execute(sql, args)
             fields = [r[0] for r in cursor.description]
             rows = cursor.fetchall()
         return [Struct(zip(fields,row)) for row in rows]
 
+    def fetchall_fields(self, sql, *args):
+        """
+        Returns field names and result rows.
+        """
+        args = args or None
+        with Executer(self, sql, args, read=True) as cursor:
+            cursor.execute(sql, args)
+            fields = [r[0] for r in cursor.description]
+            rows = cursor.fetchall()
+        return fields, rows
+
+    def iterate(self, sql, args=None, batch=1000):
+        """
+        Execute a query on an unbuffered server-side cursor, yields
+        (fields, rows) with at most `batch` rows each time.
+
+        The connection is held until the generator is exhausted or closed.
+        Out of a transaction (also in a session), a private connection is
+        checked out of the pool, so this proxy is still usable while iterating.
+        In a transaction the rows stream on the transaction's connection,
+        which can't run other statements until then (RuntimeError).
+
+        Closed before the end, the private connection is closed through its
+        pool rather than reading the rest of the result off the network.
+        A transaction's connection has to be drained.
+        """
+        args = args or None
+        if self.c and (self.transacting or not self.c.get_autocommit()):
+            proxy = self
+        else:
+            proxy = self.fork()
+        try:
+            executer = Executer(proxy, sql, args, read=True, unbuffered=True)
+            with executer as cursor:
+                cursor.execute(sql, args)
+                proxy.streaming = True
+                fields = [r[0] for r in cursor.description]
+                while 1:
+                    rows = cursor.fetchmany(batch)
+                    if not rows:
+                        break
+                    try:
+                        yield fields, rows
+                    except GeneratorExit:
+                        executer.discard = proxy is not self
+                        raise
+        finally:
+            proxy.streaming = False
+            if proxy is not self:
+                self.last_executed = proxy.last_executed
+                proxy.close()
+
     def fetchone_dict(self, sql, *args):
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args, read=True) as cursor:
             cursor.execute(sql, args)
             row = cursor.fetchone()
         if not row:
@@ -174,7 +830,7 @@ class ConnectionProxy:
         Returns affected rows and lastrowid.
         """
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args) as cursor:
             cursor.execute(sql, args)
         return cursor.rowcount, cursor.lastrowid
 
@@ -183,13 +839,13 @@ class ConnectionProxy:
         Execute a multi-row query. Returns affected rows.
         """
         args = args or None
-        with Executer(self) as cursor:
+        with Executer(self, sql, args) as cursor:
             rows = cursor.executemany(sql, args)
         return rows
 
     def callproc(self, procname, *args):
         """Execute stored procedure procname with args, returns result rows"""
-        with Executer(self) as cursor:
+        with Executer(self, procname, args) as cursor:
             cursor.callproc(procname, args)
             rows = cursor.fetchall()
         return rows
@@ -212,7 +868,11 @@ class ConnectionProxy:
         finally:
             self.transacting = False
             self.c._transacting = False
-            self.close()
+            if not self.pinned:
+                self.close()
+            for table_name in self.dirty_tables:
+                self.cache.invalidate(self.alias, table_name)
+            self.dirty_tables.clear()
 
     def __getattr__(self, table_name):
         return QuerySet(self, table_name)
@@ -234,28 +894,157 @@ class Hub:
     >>> db.default.auth_user.get(id=1)
 
     :param driver: MySQLdb or pymysql
+    :param workers: (optional)Threads of submit/gather
     """
-    def __init__(self, driver):
+    def __init__(self, driver, workers=8):
         self.pool_manager = mysql_pool.PoolManager(driver)
         self.creators = {}
-
-    def add_pool(self, alias, **connect_kwargs):
+        self.hooks = {}
+        self.replicas = {}
+        self.result_cache = ResultCache()
+        self.shards = {}
+        self.workers = workers
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+
+    def add_pool(self, alias, replicas=None, read_policy='round_robin', read_your_writes=0,
+                 **connect_kwargs):
         """
         :param pool_size: (optional)Connection pool capacity
         :param wait_timeout: (optional)Maximum retention time (SEC)
+        :param min_idle: (optional)Idle connections opened now and kept warm
+        :param ping_after: (optional)Ping connections idle longer than this (SEC)
+        :param maintain_interval: (optional)Pool maintenance interval (SEC)
+        :param pool_class: (optional)'queue' (default) or 'lifo', which reuses the
+                           most recently returned connection first
+        :param affinity: (optional)With 'lifo', give a thread its last connection back
+        :param replicas: (optional)List of read replicas, each a dict of connect
+                         arguments overriding the primary's, e.g. [{'host': 'replica1'}].
+                         Reads out of transactions and sessions go to replicas.
+        :param read_policy: (optional)'round_robin' or 'least_in_use'
+        :param read_your_writes: (optional)Seconds to read from the primary after a write
         """
+        # Timeout before throwing an exception when connecting. 
+        # (default: 10, min: 1, max: 31536000)
+        if 'connect_timeout' not in connect_kwargs:
+            connect_kwargs['connect_timeout'] = 10
         def creator():
-            # Timeout before throwing an exception when connecting. 
-            # (default: 10, min: 1, max: 31536000)
-            if 'connect_timeout' not in connect_kwargs:
-                connect_kwargs['connect_timeout'] = 10
             return self.pool_manager.connect(**connect_kwargs)
         self.creators[alias] = creator
+        if replicas:
+            pools = [self.pool_manager.get_pool(**dict(connect_kwargs, **r)) for r in replicas]
+            self.replicas[alias] = ReplicaSet(pools, read_policy, read_your_writes)
+        else:
+            self.replicas.pop(alias, None)
+        if connect_kwargs.get('min_idle'):
+            pool = self.pool_manager.get_pool(**connect_kwargs)
+            try:
+                pool.fill()
+            except Exception:
+                logging.exception('Failed to fill pool %s', alias)
+
+    def set_cache_backend(self, backend):
+        """
+        Replace the backend of QuerySet.cache, an object with get(key) and
+        set(key, value, ttl), default is an in-process TTLCache.
+        Table versions are kept in the backend too, so writes through any
+        Hub sharing it invalidate cached results of the others.
+        """
+        self.result_cache = ResultCache(backend)
+
+    def add_hook(self, hook, alias=None):
+        """
+        Register a QueryHook on every alias, or only on `alias`.
+        Statements pay nothing for hooks while none is registered.
+        """
+        self.hooks[alias] = self.hooks.get(alias, ()) + (hook,)
+
+    def remove_hook(self, hook, alias=None):
+        self.hooks[alias] = tuple(h for h in self.hooks.get(alias, ()) if h is not hook)
+
+    def get_executor(self, kind):
+        """
+        Lazily created thread pools of `workers` threads. Scatter tasks of
+        sharded queries run apart from submit(), so a submitted sharded
+        query never waits on its own pool.
+        """
+        executor = self._executors.get(kind)
+        if executor is None:
+            with self._executor_lock:
+                executor = self._executors.get(kind)
+                if executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    executor = self._executors[kind] = ThreadPoolExecutor(self.workers)
+        return executor
+
+    def _submit(self, fn, *args):
+        return self.get_executor('submit').submit(fn, *args)
+
+    def _scatter(self, fn, *args):
+        return self.get_executor('scatter').submit(fn, *args)
+
+    def submit(self, query, *args, **kw):
+        """
+        Run a QuerySet, or a raw select on `alias` (default: 'default'), in the
+        Hub's thread pool on a pooled connection of its own, and return a
+        concurrent.futures.Future of its rows. Pool limits and timeouts apply
+        as usual, errors are raised by Future.result().
+        A QuerySet in a transaction runs outside of it.
+
+        >>> users = db.submit(db.default.users.filter(active=1))
+        >>> total = db.submit("select count(*) from orders where day=%s", day)
+        >>> users.result(), total.result()
+        """
+        if isinstance(query, QuerySet):
+            return self._submit(run_queryset, query)
+        proxy = self.get_proxy(kw.get('alias', 'default'))
+        assert proxy is not None, 'Unknown alias: %s' % kw.get('alias', 'default')
+        return self._submit(run_sql, proxy, query, args)
+
+    def gather(self, *items, **kw):
+        """
+        Run QuerySets, raw selects on the default alias or Futures concurrently,
+        return their results in order. The first error is raised, unless
+        return_exceptions=True, which puts exceptions in place of results.
+
+        >>> users, orders = db.gather(db.default.users.filter(active=1),
+        >>>                           db.default.orders.filter(day=day))
+        """
+        return_exceptions = kw.get('return_exceptions', False)
+        futures = [i if hasattr(i, 'result') else self.submit(i)
+                   for i in items]
+        results = []
+        for f in futures:
+            e = f.exception()
+            if e is not None and not return_exceptions:
+                raise e
+            results.append(f.result() if e is None else e)
+        return results
+
+    def add_shards(self, alias, shards, key, shard_func=None):
+        """
+        A sharded alias over aliases added by add_pool, rows are placed by
+        shard_func(value of `key`, number of shards) => index in `shards`,
+        default: integers by modulo, others by crc32.
+        QuerySets of it run on one shard when filtered by `key` or `key__in`,
+        otherwise on all of them in parallel, see ShardedQuerySet.
+
+        >>> db.add_shards('users', ['users0', 'users1'], key='user_id')
+        >>> db.users.orders.filter(user_id=7)
+        """
+        for a in shards:
+            assert a in self.creators, 'Unknown alias: %s' % a
+        self.shards[alias] = Struct(shards=list(shards), key=key,
+                                    shard_func=shard_func or default_shard)
 
     def get_proxy(self, alias):
+        spec = self.shards.get(alias)
+        if spec:
+            return ShardedProxy(self, alias, spec.shards, spec.key, spec.shard_func)
         creator = self.creators.get(alias)
         if creator:
-            return ConnectionProxy(creator)
+            hooks = self.hooks.get(None, ()) + self.hooks.get(alias, ())
+            return ConnectionProxy(creator, hooks, alias, self.replicas.get(alias), self.result_cache)
 
     def __getattr__(self, alias):
         return self.get_proxy(alias)
@@ -267,10 +1056,202 @@ class Hub:
         return "<Hub: {}>".format(id(self))
 
 
+def run_queryset(q):
+    "flush a QuerySet on a forked proxy"
+    q = q.clone()
+    q.conn = q.conn.fork()
+    try:
+        return q.flush()
+    finally:
+        q.conn.close()
+
+
+def default_shard(v, n):
+    "integers by modulo, others by crc32"
+    if isinstance(v, IntType):
+        return v % n
+    if isinstance(v, TextType):
+        v = v.encode('utf8')
+    elif not isinstance(v, bytes):
+        v = str(v).encode('utf8')
+    return (zlib.crc32(v) & 0xffffffff) % n
+
+
+class ShardedProxy:
+    """
+    A sharded alias of Hub.add_shards, tables of it are ShardedQuerySets.
+    Raw sql can't be routed, use the proxy of a shard:
+
+    >>> db.users.shard(user_id)
+    """
+    transacting = False
+    cache = None
+
+    def __init__(self, hub, alias, shards, key, shard_func):
+        self.hub = hub
+        self.alias = alias
+        self.shards = shards
+        self.key = key
+        self.shard_func = shard_func
+
+    def shard_alias(self, v):
+        return self.shards[self.shard_func(v, len(self.shards))]
+
+    def shard(self, v):
+        "proxy of the shard holding key value v"
+        return self.hub.get_proxy(self.shard_alias(v))
+
+    def literal(self, obj):
+        return self.hub.get_proxy(self.shards[0]).literal(obj)
+
+    def escape_string(self, s):
+        return self.hub.get_proxy(self.shards[0]).escape_string(s)
+
+    def invalidate(self, table_name):
+        cache = self.hub.result_cache
+        for a in self.shards:
+            cache.invalidate(a, table_name)
+
+    def fork(self):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, table_name):
+        if not table_name.startswith('__') and hasattr(ConnectionProxy, table_name):
+            raise TypeError('%s is not supported on sharded aliases, use .shard(key).' % table_name)
+        return ShardedQuerySet(self, table_name)
+
+    def __getitem__(self, table_name):
+        return ShardedQuerySet(self, table_name)
+
+    def __str__(self):
+        return "<ShardedProxy: %s>" % self.alias
+
+
+def run_sql(proxy, sql, args):
+    try:
+        return proxy.fetchall(sql, *args)
+    finally:
+        proxy.close()
+
+
+def literal_size(v):
+    "rough upper bound of a value's size in a sql statement"
+    if v is None:
+        return 4
+    if isinstance(v, (list, tuple)):
+        return sum(literal_size(e) for e in v) + len(v) + 2
+    if isinstance(v, StringTypes):
+        # utf8 and escaping
+        return len(v) * 3 + 2
+    return len(str(v)) + 2
+
+
+class BatchLoader:
+    """
+    Coalesces single-key lookups of many threads into one IN query per
+    `window` seconds, dataloader style. The first thread of a window waits
+    for it to pass, then loads the collected keys for every waiter.
+
+    >>> users = db.default.users.loader(key='id', window=0.002)
+    >>> users.load(1)   # from any thread
+    """
+    def __init__(self, queryset, key='id', window=0.002, max_batch=1000):
+        self.qs = queryset
+        self.key = key
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def load(self, k):
+        return self.load_many([k]).get(k)
+
+    def load_many(self, keys):
+        "returns a dict of key => row"
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = Struct(ids=OrderedDict(), done=threading.Event(), result=None, error=None)
+                self._pending = batch
+            for k in keys:
+                batch.ids[k] = None
+            if len(batch.ids) >= self.max_batch:
+                # full, later lookups start a new batch
+                self._pending = None
+        if leader:
+            self.run(batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return dict((k, batch.result[k]) for k in keys if k in batch.result)
+
+    def run(self, batch):
+        time.sleep(self.window)
+        with self._lock:
+            if self._pending is batch:
+                self._pending = None
+        # a proxy of its own, leaders of different batches may run concurrently
+        q = self.qs.clone()
+        q.conn = q.conn.fork()
+        try:
+            batch.result = q.in_bulk(list(batch.ids), self.key, self.max_batch)
+        except Exception as e:
+            batch.error = e
+        finally:
+            q.conn.close()
+            batch.done.set()
+
+
+# local infile is disabled by the server or the client
+INFILE_ERRORS = (1148, 2068, 3948)
+
+def infile_value(v):
+    "a field of LOAD DATA's default tab separated format"
+    if v is None:
+        return b'\\N'
+    if isinstance(v, bool):
+        v = int(v)
+    if isinstance(v, TextType):
+        b = v.encode('utf8')
+    elif isinstance(v, bytes):
+        b = v
+    else:
+        b = str(v).encode('utf8')
+    return (b.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+             .replace(b'\r', b'\\r').replace(b'\x00', b'\\0'))
+
+
+def explain_estimate(plan):
+    "rows * filtered% of the first table of an EXPLAIN, which drives a single table select"
+    if not plan or not plan[0].get('rows'):
+        return 0
+    filtered = plan[0].get('filtered')
+    return int(round(plan[0]['rows'] * (100.0 if filtered is None else float(filtered)) / 100))
+
+
+def lookup_shape(kw):
+    "lookup keys with a marker of None/empty values, which change the compiled sql"
+    return tuple((k, 1 if v is None else (0 if v else 2)) for k, v in kw.items())
+
+
 class QuerySet:
 
     LOOKUP_SEP = '__'
 
+    # size budget of a generated multi-row statement, keep it under mysql max_allowed_packet
+    MAX_PACKET = 1024 * 1024
+
+    # compiled sql templates keyed by query shape, set None to disable
+    sql_cache = LRUCache(1024)
+
+    # row estimates of count(estimate=True), recomputed after the ttl
+    estimate_cache = TTLCache(1024, ttl=60)
+
     def __init__(self, conn, table_name, db_name=''):
         "conn: a Connection object"
         self.conn = conn
@@ -287,7 +1268,8 @@ class QuerySet:
         self.ondup_dict = {}
         self.having = ''
         self.limits = []
-        self.row_style = 0 # Element type, 0:dict, 1:2d list 2:flat list
+        self.row_style = 0 # Element type, 0:dict, 1:2d list 2:flat list 3:record
+        self.cache_ttl = None
         self._result = None
 
     def literal(self, object):
@@ -301,49 +1283,77 @@ class QuerySet:
             return u'*'
         return u','.join(fields)
 
+    def split_lookup(self, key):
+        row = key.split(self.LOOKUP_SEP, 1)
+        return row[0], row[1] if len(row)>1 else ''
+
     def make_expr(self, key, v):
         "filter expression"
-        row = key.split(self.LOOKUP_SEP, 1)
-        field = u"`{}`".format(row[0])
-        op = row[1] if len(row)>1 else ''
+        name, op = self.split_lookup(key)
+        field = u"`{}`".format(name)
+        vals = self.bind_expr(op, v)
         if not op:
             if v is None:
-                return u"{} is null".format(field), []
+                return u"{} is null".format(field), vals
             else:
-                return u"{}=%s".format(field), [v] 
+                return u"{}=%s".format(field), vals
         if op == u'gt':
-            return u"{}>%s".format(field), [v]
+            return u"{}>%s".format(field), vals
         elif op == u'gte':
-            return u"{}>=%s".format(field), [v]
+            return u"{}>=%s".format(field), vals
         elif op == u'lt':
-            return u"{}<%s".format(field), [v]
+            return u"{}<%s".format(field), vals
         elif op == u'lte':
-            return u"{}<=%s".format(field), [v]
+            return u"{}<=%s".format(field), vals
         elif op == u'ne':
             if v is None:
-                return u"{} is not null".format(field), []
+                return u"{} is not null".format(field), vals
             else:
-                return u"{}!=%s".format(field), [v]
+                return u"{}!=%s".format(field), vals
         elif op == u'in':
             if not v:
-                return u'0', []
-            return u"{} in %s".format(field), [v]
+                return u'0', vals
+            return u"{} in %s".format(field), vals
         elif op == u'ni':  # not in
             if not v:
-                return u'1', []
-            return u"{} not in %s".format(field), [v]
-        elif op == u'startswith':
-            v = u"{}%".format(v)
-            return r"{} like %s".format(field), [v]
+                return u'1', vals
+            return u"{} not in %s".format(field), vals
+        elif op in (u'startswith', u'endswith', u'contains'):
+            return r"{} like %s".format(field), vals
+        elif op == u'range':
+            return u"{} between %s and %s".format(field), vals
+        return u"{}=%s".format(key), vals
+
+    def bind_expr(self, op, v):
+        "filter expression values"
+        if op == u'startswith':
+            return [u"{}%".format(v)]
         elif op == u'endswith':
-            v = u"%{}".format(v)
-            return r"{} like %s".format(field), [v]
+            return [u"%{}".format(v)]
         elif op == u'contains':
-            v = u"%{}%".format(v)
-            return r"{} like %s".format(field), [v]
+            return [u"%{}%".format(v)]
         elif op == u'range':
-            return u"{} between %s and %s".format(field), [v[0], v[1]]
-        return u"{}=%s".format(key), [v]
+            return [v[0], v[1]]
+        elif op in (u'in', u'ni'):
+            if not v:
+                return []
+        elif op in ('', u'ne'):
+            if v is None:
+                return []
+        return [v]
+
+    def bind_vals(self, ops, *dicts):
+        "rebind values of a cached sql template"
+        vals = []
+        i = 0
+        for d in dicts:
+            for v in d.values():
+                vals += self.bind_expr(ops[i], v)
+                i += 1
+        return vals
+
+    def lookup_ops(self, *dicts):
+        return tuple(self.split_lookup(k)[1] for d in dicts for k in d)
 
     def make_cond(self, args, kw):
         # field loopup
@@ -366,6 +1376,20 @@ class QuerySet:
         return s, vals
 
     def make_where(self, cond_list, cond_dict, exclude_list, exclude_dict):
+        cache = self.sql_cache
+        if cache is None:
+            return self._make_where(cond_list, cond_dict, exclude_list, exclude_dict)
+        key = (u'where', tuple(cond_list), lookup_shape(cond_dict),
+               tuple(exclude_list), lookup_shape(exclude_dict))
+        hit = cache.get(key)
+        if hit is not None:
+            where, ops = hit
+            return where, self.bind_vals(ops, cond_dict, exclude_dict)
+        where, vals = self._make_where(cond_list, cond_dict, exclude_list, exclude_dict)
+        cache.set(key, (where, self.lookup_ops(cond_dict, exclude_dict)))
+        return where, vals
+
+    def _make_where(self, cond_list, cond_dict, exclude_list, exclude_dict):
         cond, cond_vals = self.make_cond(cond_list, cond_dict)
         exclude, ex_vals = self.make_cond(exclude_list, exclude_dict)
         vals = cond_vals + ex_vals
@@ -408,13 +1432,16 @@ class QuerySet:
         if not fields:
             return ''
         having = u" having {}".format(self.having) if self.having else ''
-        return u'group by ' + u','.join(fields) + having
+        return u'group by ' + u','.join(quote_name(f) for f in fields) + having
 
     def make_limit(self, limits):
         if not limits:
             return ''
         start, stop = limits
         if not stop:
+            if start:
+                # no upper bound, the largest limit mysql takes
+                return u"limit {}, 18446744073709551615".format(start)
             return ''
         if not start:
             return u"limit {}".format(stop)
@@ -439,34 +1466,259 @@ class QuerySet:
             group_list = self.group_list
         if limits is None:
             limits = self.limits
+        cache = self.sql_cache
+        if cache is not None:
+            key = (u'query', self.table_name, tuple(select_list),
+                   tuple(cond_list), lookup_shape(cond_dict),
+                   tuple(exclude_list), lookup_shape(exclude_dict),
+                   tuple(group_list), self.having, tuple(order_list), tuple(limits))
+            hit = cache.get(key)
+            if hit is not None:
+                sql, ops = hit
+                return sql, self.bind_vals(ops, cond_dict, exclude_dict)
         select = self.make_select(select_list)
         cond, cond_vals = self.make_where(cond_list, cond_dict, exclude_list, exclude_dict)
         order = self.make_order_by(order_list)
         group = self.make_group_by(group_list)
         limit = self.make_limit(limits)
         sql = u"select {} from {} {} {} {} {}".format(select, self.table_name, cond, group, order, limit)
+        if cache is not None:
+            cache.set(key, (sql, self.lookup_ops(cond_dict, exclude_dict)))
         return sql, cond_vals
 
     @property
     def sql(self):
         return self.make_query()
 
-    def flush(self):
-        if self._result:
-            return self._result
-        sql, args = self.make_query()
+    def make_rows(self, fields, rows):
+        "convert raw rows by row_style"
         if self.row_style == 1:
-            self._result = self.conn.fetchall(sql, *args)
+            return rows
         elif self.row_style == 2:
-            rows = self.conn.fetchall(sql, *args)
             vals = []
             for row in rows:
                 vals += row
-            self._result = vals
-        else:
-            self._result = self.conn.fetchall_dict(sql, *args)
+            return vals
+        elif self.row_style == 3:
+            return list(map(record_class(fields), rows))
+        return [Struct(zip(fields, row)) for row in rows]
+
+    def flush(self):
+        if self._result:
+            return self._result
+        sql, args = self.make_query()
+        key = self.cache_key(u'rows', sql, args)
+        if key is not None:
+            hit = self.conn.cache.get(key)
+            if hit is not None:
+                self._result = hit[0]
+                return self._result
+        fields, rows = self.conn.fetchall_fields(sql, *args)
+        self._result = self.make_rows(fields, rows)
+        if key is not None:
+            self.conn.cache.set(key, (self._result,), self.cache_ttl)
         return self._result
 
+    def cache(self, ttl=60):
+        """
+        Cache results of flush/get/count/exists for `ttl` seconds in the Hub's
+        result cache, keyed on the compiled sql and args. Writes through
+        QuerySets of the same Hub invalidate the table's entries.
+        Cached rows are shared, don't modify them.
+
+        >>> db.default.config.cache(ttl=30).get(name='site')
+        """
+        q = self.clone()
+        q.cache_ttl = ttl
+        return q
+
+    def cache_key(self, kind, sql, args):
+        "None if results shouldn't be cached"
+        if not self.cache_ttl or self.conn.cache is None or self.conn.transacting:
+            return None
+        return self.conn.cache.make_key(self.conn.alias, self.table_name,
+                                        (kind, self.row_style, sql), args)
+
+    def cached(self, kind, sql, args, fetch):
+        key = self.cache_key(kind, sql, args)
+        if key is None:
+            return fetch()
+        hit = self.conn.cache.get(key)
+        if hit is not None:
+            return hit[0]
+        value = fetch()
+        self.conn.cache.set(key, (value,), self.cache_ttl)
+        return value
+
+    def invalidate(self):
+        self.conn.invalidate(self.table_name)
+
+    def iterator(self, batch=1000):
+        """
+        Stream rows through an unbuffered server-side cursor instead of
+        loading the whole result, `batch` rows per fetch.
+        Rows are not cached on the QuerySet.
+
+        >>> for pet in db.default.pets.iterator(batch=1000):
+        >>>     print pet.name
+        """
+        sql, args = self.make_query()
+        rows_iter = self.conn.iterate(sql, args, batch)
+        try:
+            for fields, rows in rows_iter:
+                for row in self.make_rows(fields, rows):
+                    yield row
+        finally:
+            rows_iter.close()
+
+    def chunked_by(self, *keys, **kw):
+        """
+        Keyset pagination, yields pages of at most `size` rows.
+        Seeks with `key > last_seen` instead of an offset, so walking
+        the whole table costs O(n). Keys default to the current order_list,
+        prefix '-' for descending order, composite keys are supported.
+
+        >>> for pets in db.default.pets.filter(age=1).chunked_by('id', size=5000):
+        >>>     print len(pets)
+        """
+        size = kw.get('size', 1000)
+        keys = keys or [f for f in self.order_list if f != u'?'] or [u'id']
+        last = None
+        while 1:
+            sql, vals = self.make_chunk(keys, last, size)
+            fields, rows = self.conn.fetchall_fields(sql, *vals)
+            if not rows:
+                break
+            last, page = self.chunk_rows(keys, fields, rows)
+            yield page
+            if len(rows) < size:
+                break
+
+    def make_chunk(self, keys, last, size):
+        "query of the page after key values `last`, key fields are selected too"
+        names = [k[1:] if k.startswith(u'-') else k for k in keys]
+        select_list = list(self.select_list)
+        if select_list:
+            select_list += [n for n in names if n not in select_list]
+        cond_list = self.cond_list
+        seek_vals = []
+        if last is not None:
+            seek, seek_vals = self.make_seek(keys, last)
+            cond_list = cond_list + [seek]
+        sql, vals = self.make_query(select_list=select_list, cond_list=cond_list,
+                                    order_list=keys, limits=(None, size))
+        return sql, seek_vals + vals
+
+    def chunk_rows(self, keys, fields, rows):
+        "key values of the last row, and the page without added key fields"
+        names = [k[1:] if k.startswith(u'-') else k for k in keys]
+        idx = [fields.index(n) for n in names]
+        last = [rows[-1][i] for i in idx]
+        n_select = len(self.select_list)
+        if n_select and len(fields) > n_select:
+            fields = fields[:n_select]
+            rows = [row[:n_select] for row in rows]
+        return last, self.make_rows(fields, rows)
+
+    def in_bulk(self, ids, key='id', chunk=1000):
+        """
+        Load rows by a list of keys, returns a dict of key => row.
+        Keys are de-duplicated and queried `chunk` at a time.
+
+        >>> db.default.pets.in_bulk([1, 2, 2, 3])
+        >>> {1: {'id': 1, ...}, 2: {'id': 2, ...}, 3: {'id': 3, ...}}
+        """
+        result = {}
+        for sql, vals in self.make_in_bulk(ids, key, chunk):
+            fields, rows = self.conn.fetchall_fields(sql, *vals)
+            result.update(self.in_bulk_rows(key, fields, rows))
+        return result
+
+    def make_in_bulk(self, ids, key, chunk):
+        "queries of de-duplicated keys, `chunk` at a time"
+        ids = list(OrderedDict.fromkeys(ids))
+        select_list = list(self.select_list)
+        if select_list and key not in select_list:
+            select_list.append(key)
+        for i in range(0, len(ids), chunk):
+            cond_dict = dict(self.cond_dict)
+            cond_dict[key + self.LOOKUP_SEP + u'in'] = ids[i:i+chunk]
+            yield self.make_query(select_list=select_list, cond_dict=cond_dict, limits=())
+
+    def in_bulk_rows(self, key, fields, rows):
+        "(key, row) pairs, without the key field if it was added"
+        idx = fields.index(key)
+        keys = [row[idx] for row in rows]
+        n_select = len(self.select_list)
+        if n_select and len(fields) > n_select:
+            fields = fields[:n_select]
+            rows = [row[:n_select] for row in rows]
+        if self.row_style == 2:
+            objs = [row[0] if len(fields) == 1 else row for row in rows]
+        else:
+            objs = self.make_rows(fields, rows)
+        return zip(keys, objs)
+
+    def loader(self, key='id', window=0.002, max_batch=1000):
+        """
+        A BatchLoader of this QuerySet, which coalesces concurrent
+        single-key lookups into one in_bulk query.
+        """
+        return BatchLoader(self, key, window, max_batch)
+
+    def make_seek(self, keys, last):
+        "(a > %s) or (a = %s and b < %s) ..."
+        ors = []
+        vals = []
+        for i, k in enumerate(keys):
+            ands = []
+            for j in range(i):
+                ands.append(u"`{}`=%s".format(keys[j].lstrip(u'-')))
+                vals.append(last[j])
+            if k.startswith(u'-'):
+                ands.append(u"`{}`<%s".format(k[1:]))
+            else:
+                ands.append(u"`{}`>%s".format(k))
+            vals.append(last[i])
+            ors.append(u' and '.join(ands))
+        return u' or '.join(u"({})".format(s) for s in ors), vals
+
+    def make_columns(self, fields, rows, as_numpy=False):
+        if rows:
+            cols = zip(*rows)
+        else:
+            cols = [()] * len(fields)
+        return Struct((f, make_column(col, as_numpy)) for f, col in zip(fields, cols))
+
+    def columns(self, *fields, **kw):
+        """
+        Column oriented result, a Struct of field => column.
+        Integer and float columns come back as array.array,
+        or numpy arrays with numpy=True.
+
+        >>> db.default.pets.filter(id__lt=4).columns('id', 'name')
+        >>> {'id': array('q', [1, 2, 3]), 'name': ['cat', 'dog', 'bird']}
+        """
+        as_numpy = kw.get('numpy', False)
+        sql, args = self.make_query(select_list=fields or None)
+        names, rows = self.conn.fetchall_fields(sql, *args)
+        return self.make_columns(names, rows, as_numpy)
+
+    def iter_columns(self, *fields, **kw):
+        """
+        Stream columns through an unbuffered server-side cursor, yields
+        a Struct of field => column for every `batch` rows.
+        """
+        batch = kw.get('batch', 1000)
+        as_numpy = kw.get('numpy', False)
+        sql, args = self.make_query(select_list=fields or None)
+        rows_iter = self.conn.iterate(sql, args, batch)
+        try:
+            for names, rows in rows_iter:
+                yield self.make_columns(names, rows, as_numpy)
+        finally:
+            rows_iter.close()
+
     def clone(self):
         new = copy.copy(self)
         new_dict = new.__dict__
@@ -510,13 +1762,34 @@ class QuerySet:
             q.select_list = fields
         return q
 
-    def get(self, *args, **kw):
+    def records(self, *fields):
+        """
+        Compact rows sharing one field index, see Record.
+        """
+        q = self.clone()
+        q.row_style = 3
+        if fields:
+            q.select_list = fields
+        return q
+
+    def make_get(self, *args, **kw):
         cond_dict = dict(self.cond_dict)
         cond_dict.update(kw)
         cond_list = self.cond_list + list(args)
-        sql, vals = self.make_query(cond_list=cond_list, cond_dict=cond_dict, limits=(None,1))
+        return self.make_query(cond_list=cond_list, cond_dict=cond_dict, limits=(None,1))
+
+    def get(self, *args, **kw):
+        sql, vals = self.make_get(*args, **kw)
+        if self.cache_ttl:
+            return self.cached(u'get', sql, vals, lambda: self.fetch_one(sql, vals))
+        return self.fetch_one(sql, vals)
+
+    def fetch_one(self, sql, vals):
         if self.row_style == 1:
             return self.conn.fetchone(sql, *vals)
+        elif self.row_style == 3:
+            fields, rows = self.conn.fetchall_fields(sql, *vals)
+            return self.make_rows(fields, rows)[0] if rows else None
         else:
             return self.conn.fetchone_dict(sql, *vals)
 
@@ -547,8 +1820,7 @@ class QuerySet:
         q.ondup_dict = kw
         return q
 
-    def create(self, ignore=False, **kw):
-        "Returns lastrowid"
+    def make_create(self, ignore=False, **kw):
         tokens = u','.join([u'%s']*len(kw))
         fields = [u"`{}`".format(k) for k in kw.keys()]
         fields = u','.join(fields)
@@ -560,16 +1832,20 @@ class QuerySet:
             ondup_s = u' ON DUPLICATE KEY UPDATE ' + statement
         sql = u"insert{} into {} ({}) values ({}){}".format(ignore_s, self.table_name, fields, tokens, ondup_s)
         values = list(kw.values()) + ondup_vals
+        return sql, values
+
+    def create(self, ignore=False, **kw):
+        "Returns lastrowid"
+        sql, values = self.make_create(ignore, **kw)
         _, lastid = self.conn.execute(sql, *values)
+        self.invalidate()
         return lastid
 
-    def bulk_create(self, obj_list, ignore=False):
-        "Returns affectrows"
-        if not obj_list:
-            return
-        kw = obj_list[0]
-        tokens = u','.join(['%s']*len(kw))
-        fields = [u"`{}`".format(k) for k in kw.keys()]
+    def make_bulk_create(self, obj_list, ignore=False, max_packet=None, batch_size=None):
+        "yields (sql, vals) of every batch"
+        keys = list(obj_list[0].keys())
+        tokens = u','.join(['%s']*len(keys))
+        fields = [u"`{}`".format(k) for k in keys]
         fields = u','.join(fields)
         ignore_s = u' IGNORE' if ignore else ''
         ondup_s = ''
@@ -577,31 +1853,320 @@ class QuerySet:
         if self.ondup_list or self.ondup_dict:
             update_fields, ondup_vals = self.make_update_fields(self.ondup_list, self.ondup_dict)
             ondup_s = u' ON DUPLICATE KEY UPDATE ' + update_fields
-            sql = u"insert{} into {} ({}) values ({}){}".format(ignore_s, self.table_name, fields, tokens, ondup_s)
+        head = u"insert{} into {} ({}) values ".format(ignore_s, self.table_name, fields)
+        budget = (max_packet or self.MAX_PACKET) - len(head) - len(ondup_s) - literal_size(ondup_vals)
+        row_tokens = u"({})".format(tokens)
+        rows = ([o[k] for k in keys] for o in obj_list)
+        for batch in self.make_batches(rows, budget, batch_size):
+            sql = head + u','.join([row_tokens]*len(batch)) + ondup_s
+            vals = [v for row in batch for v in row] + ondup_vals
+            yield sql, vals
+
+    def bulk_create(self, obj_list, ignore=False, max_packet=None, batch_size=None, workers=None):
+        """
+        Returns affectrows.
+
+        Rows are sent as multi-row INSERT statements in the column order of the
+        first row, split into batches of at most `batch_size` rows and
+        `max_packet` bytes (default MAX_PACKET).
+        With `workers`, batches run concurrently on that many pooled connections,
+        BulkError is raised with the per-batch results if any batch fails.
+        """
+        if not obj_list:
+            return
+        statements = self.make_bulk_create(obj_list, ignore, max_packet, batch_size)
+        if not workers:
             affected_rows = 0
-            for o in obj_list:
-                vals = list(o.values()) + ondup_vals
+            try:
+                for sql, vals in statements:
+                    n, _ = self.conn.execute(sql, *vals)
+                    affected_rows += n
+            finally:
+                self.invalidate()
+            return affected_rows
+
+        assert not self.conn.transacting, 'Parallel bulk_create can not join a transaction.'
+
+        def insert(sql, vals):
+            conn = self.conn.fork()
+            try:
+                n, _ = conn.execute(sql, *vals)
+                if conn.c:
+                    # autocommit is off
+                    conn.commit()
+                return n
+            finally:
+                conn.close()
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(insert, sql, vals) for sql, vals in statements]
+        self.invalidate()
+        results = [f.exception() or f.result() for f in futures]
+        if any(isinstance(r, Exception) for r in results):
+            raise BulkError(results)
+        return sum(results)
+
+    def load(self, rows, columns, mode=None, batch_size=1000):
+        """
+        Bulk load an iterable of rows, each a sequence in `columns` order,
+        with LOAD DATA LOCAL INFILE. Rows are streamed through a named pipe,
+        so the file is never materialized in memory or on disk.
+        Returns affected rows. An error of the iterable is raised after the
+        statement, rows sent before it stay loaded unless in a transaction.
+
+        :param mode: None, 'ignore' or 'replace', for duplicate keys
+        :param batch_size: rows per statement of the INSERT fallback, used
+                           when local infile is not allowed by the driver or
+                           server, or named pipes are not available
+        """
+        assert mode in (None, u'ignore', u'replace'), 'Unknown load mode: %s' % mode
+        rows = iter(rows)
+        local_infile = None
+        if hasattr(os, 'mkfifo'):
+            try:
+                local_infile = getattr(self.conn.connect(), '_local_infile', None)
+            finally:
+                # the probe's checkout, kept only by a transaction or session
+                self.conn.release()
+        if hasattr(os, 'mkfifo') and local_infile is not False:
+            state = Struct(started=False)
+            try:
+                n = self.load_infile(rows, columns, mode, state)
+                self.invalidate()
+                return n
+            except Exception as e:
+                args = getattr(e, 'args', None)
+                if state.started or not args or args[0] not in INFILE_ERRORS:
+                    if state.started:
+                        self.invalidate()
+                    raise
+                logging.info('LOAD DATA LOCAL INFILE is not allowed, fall back to INSERT: %s', e)
+        return self.load_insert(rows, columns, mode, batch_size)
+
+    def load_infile(self, rows, columns, mode, state):
+        fields = u','.join(u"`{}`".format(c) for c in columns)
+        mode_s = {None: u'', u'ignore': u' IGNORE', u'replace': u' REPLACE'}[mode]
+        sql = (u"LOAD DATA LOCAL INFILE %s{} INTO TABLE {} CHARACTER SET utf8mb4 ({})"
+               .format(mode_s, self.table_name, fields))
+        tmpdir = tempfile.mkdtemp(prefix='lorm-')
+        path = os.path.join(tmpdir, 'rows.tsv')
+        os.mkfifo(path, 0o600)
+        state.abort = False
+        state.error = None
+
+        def write():
+            try:
+                # blocks until the driver opens the pipe
+                with open(path, 'wb') as f:
+                    if state.abort:
+                        return
+                    state.started = True
+                    for row in rows:
+                        if state.abort:
+                            return
+                        f.write(b'\t'.join([infile_value(v) for v in row]) + b'\n')
+            except Exception as e:
+                if state.abort and getattr(e, 'errno', None) == errno.EPIPE:
+                    # the driver stopped reading, the statement reports the error
+                    return
+                state.error = e
+
+        writer = threading.Thread(target=write, name='lorm-load-data')
+        writer.daemon = True
+        writer.start()
+        try:
+            n, _ = self.conn.execute(sql, path)
+        finally:
+            state.abort = True
+            # hold the read end and drain it, so the writer is never left blocked
+            # in open() or write() when the driver stopped early or never started
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                while writer.is_alive():
+                    try:
+                        os.read(fd, 65536)
+                    except OSError:
+                        writer.join(0.01)
+            finally:
+                os.close(fd)
+            os.unlink(path)
+            os.rmdir(tmpdir)
+        if state.error is not None:
+            # the pipe was closed early on the error, the server took it as the end
+            raise state.error
+        return n
+
+    def load_insert(self, rows, columns, mode, batch_size):
+        q = self
+        if mode == u'replace':
+            q = self.ondup(*[u"`{0}`=VALUES(`{0}`)".format(c) for c in columns])
+        affected_rows = 0
+        while 1:
+            chunk = [Struct(zip(columns, row)) for row in itertools.islice(rows, batch_size * 10)]
+            if not chunk:
+                break
+            affected_rows += q.bulk_create(chunk, ignore=mode == u'ignore', batch_size=batch_size)
+        return affected_rows
+
+    def make_bulk_update(self, rows, key='id', fields=None, batch_size=1000, max_packet=None, ondup=False):
+        "yields (sql, vals) of every batch"
+        if fields is None:
+            fields = [k for k in rows[0].keys() if k != key]
+        if not fields:
+            return
+        if ondup:
+            q = self.ondup(*[u"`{0}`=VALUES(`{0}`)".format(f) for f in fields])
+            columns = [key] + list(fields)
+            obj_list = [Struct(zip(columns, [o[c] for c in columns])) for o in rows]
+            for statement in q.make_bulk_create(obj_list, max_packet=max_packet, batch_size=batch_size):
+                yield statement
+            return
+
+        key_field = u"`{}`".format(key)
+        in_cond = u"{} in %s".format(key_field)
+        head = u"update {} set ".format(self.table_name)
+        budget = (max_packet or self.MAX_PACKET) - len(head)
+        def sizeof(row):
+            # the key is repeated in every case expression
+            return literal_size(row) + (literal_size(row[0]) + 12) * len(fields)
+        vals_iter = ([o[key]] + [o[f] for f in fields] for o in rows)
+        for batch in self.make_batches(vals_iter, budget, batch_size, sizeof):
+            whens = u' '.join([u'when %s then %s'] * len(batch))
+            sets = []
+            vals = []
+            for i, f in enumerate(fields, 1):
+                sets.append(u"`{0}`=case {1} {2} else `{0}` end".format(f, key_field, whens))
+                for row in batch:
+                    vals += [row[0], row[i]]
+            vals.append([row[0] for row in batch])
+            cond, cond_vals = self.make_where(self.cond_list + [in_cond], self.cond_dict,
+                                              self.exclude_list, self.exclude_dict)
+            yield head + u', '.join(sets) + u' ' + cond, vals + cond_vals
+
+    def bulk_update(self, rows, key='id', fields=None, batch_size=1000, max_packet=None, ondup=False):
+        """
+        Update many rows with different values, returns affected rows.
+
+        >>> db.default.pets.bulk_update([{'id':1, 'name':'cat'}, {'id':2, 'name':'dog'}])
+
+        Every batch is one UPDATE ... SET col = CASE key WHEN ... END WHERE key IN (...),
+        current filters are kept. With ondup=True, batches are sent as
+        INSERT ... ON DUPLICATE KEY UPDATE col=VALUES(col) instead, which
+        inserts missing keys and ignores filters.
+        """
+        if not rows:
+            return 0
+        affected_rows = 0
+        try:
+            for sql, vals in self.make_bulk_update(rows, key, fields, batch_size, max_packet, ondup):
                 n, _ = self.conn.execute(sql, *vals)
                 affected_rows += n
-            return affected_rows
-        else:
-            sql = u"insert{} into {} ({}) values ({})".format(ignore_s, self.table_name, fields, tokens)
-            args = [list(o.values()) for o in obj_list]
-            return self.conn.execute_many(sql, args)
+        finally:
+            self.invalidate()
+        return affected_rows
+
+    def make_batches(self, rows, max_bytes, max_rows=None, sizeof=literal_size):
+        "split rows into batches by estimated sql size and row count"
+        batch = []
+        size = 0
+        for row in rows:
+            n = sizeof(row)
+            if batch and (size + n > max_bytes or (max_rows and len(batch) >= max_rows)):
+                yield batch
+                batch = []
+                size = 0
+            batch.append(row)
+            size += n
+        if batch:
+            yield batch
+
+    def make_count(self):
+        return self.make_query(select_list=[u'count(*) n'], order_list=[], limits=[None,1])
+
+    def make_exists(self):
+        return self.make_query(select_list=[u'1'], order_list=[], limits=[None,1])
+
+    def make_aggregate(self, **aggregates):
+        select_list = [a.as_sql(name) for name, a in sorted(aggregates.items())]
+        return self.make_query(select_list=select_list, group_list=[], order_list=[],
+                               limits=[None, None])
+
+    def aggregate(self, **aggregates):
+        """
+        Aggregates over all matched rows in one Struct, computed by the server.
 
-    def count(self):
+        >>> db.default.orders.filter(day=day).aggregate(total=Sum('amount'), peak=Max('ts'))
+        {'peak': datetime.datetime(2018, 3, 13, 23, 59), 'total': Decimal('1024.00')}
+        """
+        sql, vals = self.make_aggregate(**aggregates)
+        def fetch():
+            fields, rows = self.conn.fetchall_fields(sql, *vals)
+            return Struct(zip(fields, rows[0])) if rows else Struct()
+        if self.cache_ttl:
+            return self.cached(u'agg', sql, vals, fetch)
+        return fetch()
+
+    def annotate(self, **aggregates):
+        """
+        Select the group_by fields and aggregates per group, as Records unless
+        another row style is set.
+
+        >>> for r in db.default.orders.group_by('day').annotate(n=Count('*')).order_by('-n'):
+        >>>     print r.day, r.n
+        """
+        q = self.clone()
+        q.select_list = [quote_name(f) for f in self.group_list] + \
+                        [a.as_sql(name) for name, a in sorted(aggregates.items())]
+        if q.row_style == 0:
+            q.row_style = 3
+        return q
+
+    def explain(self):
+        "EXPLAIN rows of the compiled query, as Structs"
+        sql, vals = self.make_query()
+        return self.conn.fetchall_dict(u"explain " + sql, *vals)
+
+    def make_estimate(self):
+        sql, vals = self.make_query(select_list=[u'1'], order_list=[], limits=[None, None])
+        return u"explain " + sql, vals
+
+    def count(self, estimate=False):
+        """
+        :param estimate: (optional)Rows estimated by EXPLAIN from index statistics
+                         (rows * filtered%) instead of select count(*), cached for
+                         estimate_cache.ttl seconds. Far cheaper on huge tables,
+                         but can be off by a wide margin.
+        """
         if self._result is not None:
             return len(self._result)
-        sql, vals = self.make_query(select_list=[u'count(*) n'], order_list=[], limits=[None,1])
-        row = self.conn.fetchone(sql, *vals)
+        if estimate:
+            return self.estimate()
+        sql, vals = self.make_count()
+        if self.cache_ttl:
+            row = self.cached(u'one', sql, vals, lambda: self.conn.fetchone(sql, *vals))
+        else:
+            row = self.conn.fetchone(sql, *vals)
         n = row[0] if row else 0
         return n
 
+    def estimate(self):
+        sql, vals = self.make_estimate()
+        key = (self.conn.alias, sql, repr(vals))
+        n = self.estimate_cache.get(key)
+        if n is None:
+            n = explain_estimate(self.conn.fetchall_dict(sql, *vals))
+            self.estimate_cache.set(key, n)
+        return n
+
     def exists(self):
         if self._result is not None:
             return True
-        sql, vals = self.make_query(select_list=[u'1'], order_list=[], limits=[None,1])
-        row = self.conn.fetchone(sql, *vals)
+        sql, vals = self.make_exists()
+        if self.cache_ttl:
+            row = self.cached(u'one', sql, vals, lambda: self.conn.fetchone(sql, *vals))
+        else:
+            row = self.conn.fetchone(sql, *vals)
         b = bool(row)
         return b
 
@@ -614,25 +2179,34 @@ class QuerySet:
             return f1, []
         return f2, list(kw.values())
 
-    def update(self, *args, **kw):
-        "return affected rows"
-        if not args and not kw:
-            return 0
-        vals = []
+    def make_update(self, *args, **kw):
         cond, cond_vals = self.make_where(self.cond_list, self.cond_dict, self.exclude_list, self.exclude_dict)
         update_fields, update_vals = self.make_update_fields(args, kw)
         vals = update_vals + cond_vals 
         sql = u"update {} set {} {}".format(self.table_name, update_fields, cond)
+        return sql, vals
+
+    def update(self, *args, **kw):
+        "return affected rows"
+        if not args and not kw:
+            return 0
+        sql, vals = self.make_update(*args, **kw)
         n, _ = self.conn.execute(sql, *vals)
+        self.invalidate()
         return n
 
-    def delete(self, *names):
-        "return affected rows"
+    def make_delete(self, *names):
         cond, vals = self.make_where(self.cond_list, self.cond_dict, self.exclude_list, self.exclude_dict)
         limit = self.make_limit(self.limits)
         d_names = u','.join(names)
         sql = u"delete {} from {} {} {}".format(d_names, self.table_name, cond, limit)
+        return sql, vals
+
+    def delete(self, *names):
+        "return affected rows"
+        sql, vals = self.make_delete(*names)
         n, _ = self.conn.execute(sql, *vals)
+        self.invalidate()
         return n
 
     def __iter__(self):
@@ -657,8 +2231,6 @@ class QuerySet:
             start = None if k.start is None else int(k.start)
             stop = None if k.stop is None else int(k.stop)
             assert k.step is None, 'Slice step is not supported.'
-            if start and stop is None:
-                stop = self.count()
             q.limits = [start, stop]
             return q.flush()
 
@@ -667,3 +2239,195 @@ class QuerySet:
 
     def __nonzero__(self):      # Python 2 compatibility
         return self.exists()
+
+
+class ShardedQuerySet(QuerySet):
+    """
+    QuerySet of a sharded alias. Filters on the shard key (exact or __in)
+    and create kwargs pick the shards, other queries scatter to all shards
+    in parallel and gather: rows are merged by order_by (NULLs first, as
+    MySQL does) and cut by the slice, counts summed, exists OR-ed,
+    update/delete affected rows summed.
+    Grouped queries are merged per shard, not regrouped. Streaming and bulk
+    key methods raise TypeError, run them on one shard with .on(alias).
+    """
+    def on(self, alias):
+        "this query as a plain QuerySet of one shard"
+        q = QuerySet.clone(self)
+        q.__class__ = QuerySet
+        q.conn = self.conn.hub.get_proxy(alias)
+        return q
+
+    def route(self, kw=None):
+        "OrderedDict of shard alias => QuerySet on it"
+        p = self.conn
+        cond = dict(self.cond_dict)
+        cond.update(kw or {})
+        if p.key in cond:
+            alias = p.shard_alias(cond[p.key])
+            return OrderedDict([(alias, self.on(alias))])
+        in_key = p.key + self.LOOKUP_SEP + u'in'
+        if in_key in cond and cond[in_key]:
+            groups = OrderedDict()
+            for v in cond[in_key]:
+                groups.setdefault(p.shard_alias(v), []).append(v)
+            subs = OrderedDict()
+            for alias, vs in groups.items():
+                q = subs[alias] = self.on(alias)
+                q.cond_dict[in_key] = vs
+            return subs
+        return OrderedDict((a, self.on(a)) for a in p.shards)
+
+    def scatter(self, subs, fn):
+        "fn(q) of every shard QuerySet, in parallel when there are several"
+        def run(q):
+            try:
+                return fn(q)
+            finally:
+                q.conn.close()
+
+        if len(subs) == 1:
+            return [run(q) for q in subs.values()]
+        futures = [self.conn.hub._scatter(run, q) for q in subs.values()]
+        return [f.result() for f in futures]
+
+    def sort_rows(self, fields, rows):
+        "sort raw rows of all shards by order_by"
+        # stable sorts, least significant order first
+        for f in reversed(self.order_list):
+            if f == u'?':
+                random.shuffle(rows)
+                continue
+            desc = f.startswith(u'-')
+            i = fields.index(f.lstrip(u'-').strip(u'`'))
+            rows.sort(key=lambda r: (r[i] is not None, r[i]), reverse=desc)
+        return rows
+
+    def flush(self):
+        if self._result:
+            return self._result
+        subs = self.route()
+        if len(subs) == 1:
+            self._result = self.scatter(subs, QuerySet.flush)[0]
+            return self._result
+        start, stop = self.limits or (None, None)
+        # every shard may hold the first `stop` rows
+        for q in subs.values():
+            q.limits = [None, stop]
+        # order fields are selected too for the merge
+        select_list = list(self.select_list)
+        if select_list:
+            selected = [f.strip(u'`') for f in select_list]
+            select_list += [n for n in (f.lstrip(u'-').strip(u'`') for f in self.order_list)
+                            if n != u'?' and n not in selected]
+
+        def fetch(q):
+            sql, args = q.make_query(select_list=select_list)
+            return q.cached(u'fields', sql, args, lambda: q.conn.fetchall_fields(sql, *args))
+
+        fields, rows = None, []
+        for fields, r in self.scatter(subs, fetch):
+            rows += r
+        if self.order_list:
+            rows = self.sort_rows(fields, rows)
+        if self.limits:
+            rows = rows[start or 0:stop]
+        n_select = len(self.select_list)
+        if n_select and len(fields) > n_select:
+            fields = fields[:n_select]
+            rows = [row[:n_select] for row in rows]
+        self._result = self.make_rows(fields, rows)
+        return self._result
+
+    def get(self, *args, **kw):
+        rows = self.scatter(self.route(kw), lambda q: QuerySet.get(q, *args, **kw))
+        for row in rows:
+            if row is not None:
+                return row
+
+    def aggregate(self, **aggregates):
+        "aggregates of every shard merged, Avg can't be merged"
+        for a in aggregates.values():
+            assert not isinstance(a, Avg), 'Avg is not supported on shards, use Sum and Count.'
+            assert not a.distinct, 'Distinct aggregates are not supported on shards.'
+        merged = Struct()
+        for r in self.scatter(self.route(), lambda q: QuerySet.aggregate(q, **aggregates)):
+            for name, a in aggregates.items():
+                v, m = r.get(name), merged.get(name)
+                if v is None or m is None:
+                    merged[name] = m if v is None else v
+                elif isinstance(a, Max):
+                    merged[name] = max(m, v)
+                elif isinstance(a, Min):
+                    merged[name] = min(m, v)
+                else:
+                    merged[name] = m + v
+        return merged
+
+    def explain(self):
+        "OrderedDict of shard alias => EXPLAIN rows on it"
+        subs = self.route()
+        return OrderedDict(zip(subs, self.scatter(subs, QuerySet.explain)))
+
+    def count(self, estimate=False):
+        if self._result is not None:
+            return len(self._result)
+        return sum(self.scatter(self.route(), lambda q: QuerySet.count(q, estimate)))
+
+    def exists(self):
+        if self._result is not None:
+            return True
+        return any(self.scatter(self.route(), QuerySet.exists))
+
+    def estimate(self):
+        return self.count(estimate=True)
+
+    def iterator(self, batch=1000):
+        raise TypeError('iterator is not supported on sharded aliases, use .on(alias).')
+
+    def chunked_by(self, *keys, **kw):
+        raise TypeError('chunked_by is not supported on sharded aliases, use .on(alias).')
+
+    def in_bulk(self, ids, key='id', chunk=1000):
+        raise TypeError('in_bulk is not supported on sharded aliases, use .on(alias).')
+
+    def loader(self, *args, **kw):
+        raise TypeError('loader is not supported on sharded aliases, use .on(alias).')
+
+    def columns(self, *fields, **kw):
+        raise TypeError('columns is not supported on sharded aliases, use .on(alias).')
+
+    def iter_columns(self, *fields, **kw):
+        raise TypeError('iter_columns is not supported on sharded aliases, use .on(alias).')
+
+    def load(self, *args, **kw):
+        raise TypeError('load is not supported on sharded aliases, use .on(alias).')
+
+    def bulk_update(self, *args, **kw):
+        raise TypeError('bulk_update is not supported on sharded aliases, use .on(alias).')
+
+    def create(self, ignore=False, **kw):
+        key = self.conn.key
+        assert key in kw, 'Shard key %s is required.' % key
+        q = self.on(self.conn.shard_alias(kw[key]))
+        return self.scatter({None: q}, lambda q: QuerySet.create(q, ignore, **kw))[0]
+
+    def bulk_create(self, obj_list, ignore=False, max_packet=None, batch_size=None, workers=None):
+        if not obj_list:
+            return
+        key = self.conn.key
+        groups = OrderedDict()
+        for obj in obj_list:
+            assert key in obj, 'Shard key %s is required.' % key
+            groups.setdefault(self.conn.shard_alias(obj[key]), []).append(obj)
+        subs = OrderedDict((a, self.on(a)) for a in groups)
+        return sum(self.scatter(subs, lambda q: QuerySet.bulk_create(
+            q, groups[q.conn.alias], ignore, max_packet, batch_size, workers)))
+
+    def update(self, *args, **kw):
+        if not args and not kw:
+            return 0
+        return sum(self.scatter(self.route(), lambda q: QuerySet.update(q, *args, **kw)))
+
+    def delete(self, *names):
+        return sum(self.scatter(self.route(), lambda q: QuerySet.delete(q, *names)))
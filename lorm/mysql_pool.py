@@ -5,6 +5,8 @@ import time
 import threading
 import logging
 import types
+import bisect
+from collections import deque
 
 py3k = sys.version_info.major > 2
 
@@ -23,22 +25,66 @@ class TimeoutError(Exception):
     pass
 
 
+# upper bounds (SEC) of the checkout wait histogram buckets, the last bucket is unbounded
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolStats:
+    """
+    Counters and checkout wait histogram of a pool.
+    Updated without locks, so values are approximate under heavy concurrency.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0       # returned by close(), not requeued by fill/maintain
+        self.created = 0
+        self.closed = 0
+        self.recycled = 0       # closed for exceeding recycle
+        self.broken = 0         # closed for (2006, 2013) errors
+        self.ping_failures = 0
+        self.timeouts = 0
+        self.exhausted = 0      # checkouts with overflow at zero, which may block
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_hist = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe_wait(self, t):
+        self.checkouts += 1
+        self.wait_total += t
+        if t > self.wait_max:
+            self.wait_max = t
+        self.wait_hist[bisect.bisect_left(WAIT_BUCKETS, t)] += 1
+
+    def snapshot(self):
+        d = dict(self.__dict__)
+        d['wait_hist'] = list(zip(WAIT_BUCKETS + (None,), self.wait_hist))
+        d['wait_avg'] = self.wait_total / self.checkouts if self.checkouts else 0.0
+        return d
+
+
 class QueuePool:
-    def __init__(self, creator, pool_size=5, timeout=2.0, recycle=None):
+    def __init__(self, creator, pool_size=5, timeout=2.0, recycle=None,
+                 min_idle=0, ping_after=None):
         """
         :param creator: 回调函数, 返回值为连接对象
         :param pool_size: 连接池大小, 最多保持几个连接
         :param timeout: 队列阻塞超时时间(秒), 为了防止大量突发连接造成(1040, 'Too many connections')
         :param recycle: 连接保持时间(秒), 不能超过mysql的wait_timeout.
                         查看wait_timeout的方法: show variables like 'wait_timeout'
+        :param min_idle: 维护线程保持的最少空闲连接数
+        :param ping_after: 空闲超过这个时间(秒)的连接, 由维护线程ping一下, 失败则关闭
         """
         self.creator = creator
         self.timeout = timeout
         self.recycle = recycle
+        self.min_idle = min_idle
+        self.ping_after = ping_after
         self.q = queue.Queue(pool_size)
         self.cset = set()  # 保证队列成员不重复
         self.overflow = -pool_size
         self._overflow_lock = threading.Lock()
+        self._maintainer = None
+        self.metrics = PoolStats()
 
     def inc_overflow(self):
         with self._overflow_lock:
@@ -56,15 +102,18 @@ class QueuePool:
     def create_connection(self):
         now = time.time()
         c = self.creator()
+        self.metrics.created += 1
         c._pool = self
         c._activetime = now
         c._transacting = False
         return c
 
     def close(self, conn):
-        if not conn.open:
+        # 已断开的连接也要归还overflow名额
+        if getattr(conn, '_pool', None) is not self:
             return
         del conn._pool
+        self.metrics.closed += 1
         try:
             conn._close()
         except:
@@ -74,15 +123,28 @@ class QueuePool:
             self.dec_overflow()
 
     def connect(self):
+        t = time.time()
+        try:
+            c = self._connect()
+        except TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe_wait(time.time() - t)
+        return c
+
+    def _connect(self):
         block = False
         try:
             while 1:
                 block = self.overflow >= 0
+                if block:
+                    self.metrics.exhausted += 1
                 c = self.q.get(block, self.timeout)
                 if c in self.cset:
                     self.cset.remove(c)
                 now = time.time()
                 if self.recycle is not None and now - c._activetime >= self.recycle:
+                    self.metrics.recycled += 1
                     self.close(c)
                 else:
                     #c._activetime = now
@@ -92,7 +154,7 @@ class QueuePool:
         except queue.Empty:
             if self.overflow >= 0:
                 if not block:
-                    return self.connect()
+                    return self._connect()
                 else:
                     raise TimeoutError(
                         "QueuePool limit of size %d, "
@@ -108,10 +170,12 @@ class QueuePool:
 
     def return_conn(self, conn):
         if not conn.open:
+            self.close(conn)
             return
         if conn in self.cset:
             return
-        if time.time() - conn._activetime >= self.recycle:
+        if self.recycle is not None and time.time() - conn._activetime >= self.recycle:
+            self.metrics.recycled += 1
             self.close(conn)
             return
         try:
@@ -121,12 +185,85 @@ class QueuePool:
             logging.warning('QueuePool Full: %s' % self.q.qsize())
             self.close(conn)
 
+    def fill(self, n=None):
+        """
+        Open connections until n (default min_idle) are idle, bounded by pool_size.
+        """
+        if n is None:
+            n = self.min_idle
+        while self.len() < n and self.inc_overflow():
+            try:
+                c = self.create_connection()
+            except:
+                self.dec_overflow()
+                raise
+            self.return_conn(c)
+
+    def maintain(self):
+        """
+        One maintenance pass over idle connections: close the ones idle
+        longer than recycle, ping the ones idle longer than ping_after,
+        then refill to min_idle.
+        """
+        now = time.time()
+        for _ in range(self.q.qsize()):
+            try:
+                c = self.q.get(False)
+            except queue.Empty:
+                break
+            self.cset.discard(c)
+            idle = now - c._activetime
+            if self.recycle is not None and idle >= self.recycle:
+                self.metrics.recycled += 1
+                self.close(c)
+                continue
+            if self.ping_after is not None and idle >= self.ping_after:
+                try:
+                    c.ping(False)
+                except:
+                    self.metrics.ping_failures += 1
+                    self.close(c)
+                    continue
+            self.return_conn(c)
+        self.fill()
+
+    def start_maintenance(self, interval=10):
+        "Run maintain() every `interval` seconds in a daemon thread."
+        if self._maintainer:
+            return
+        stop = threading.Event()
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.maintain()
+                except Exception:
+                    logging.exception('QueuePool maintenance failed')
+        t = threading.Thread(target=run, name='lorm-pool-maintenance')
+        t.daemon = True
+        self._maintainer = stop
+        t.start()
+
+    def stop_maintenance(self):
+        if self._maintainer:
+            self._maintainer.set()
+            self._maintainer = None
+
     def size(self):
         return self.q.maxsize
 
     def len(self):
         return self.q.qsize()
 
+    def in_use(self):
+        "connections checked out of the pool"
+        return max(self.overflow + self.size() - self.len(), 0)
+
+    def stats(self):
+        d = self.metrics.snapshot()
+        d.update(size=self.size(), idle=self.len(), in_use=self.in_use(),
+                 overflow=self.overflow, timeout=self.timeout, recycle=self.recycle)
+        return d
+
     def clear(self):
         q = self.q
         self.q = queue.Queue(q.maxsize)
@@ -138,9 +275,179 @@ class QueuePool:
                 break
 
 
+class LifoPool(QueuePool):
+    """
+    Hands out the most recently returned connection first, so spare connections
+    stay idle and age out by recycle or maintenance instead of being kept
+    barely alive by rotation. Checkouts and checkins are a deque pop/append,
+    lock free under the GIL, only waiting for a connection takes a lock.
+
+    :param affinity: give a thread back its last connection when still idle
+    """
+    def __init__(self, creator, pool_size=5, timeout=2.0, recycle=None,
+                 min_idle=0, ping_after=None, affinity=False):
+        self.creator = creator
+        self.timeout = timeout
+        self.recycle = recycle
+        self.min_idle = min_idle
+        self.ping_after = ping_after
+        self.affinity = affinity
+        self.pool_size = pool_size
+        self.idle = deque()
+        self.overflow = -pool_size
+        self._overflow_lock = threading.Lock()
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = 0
+        self._local = threading.local()
+        self._maintainer = None
+        self.metrics = PoolStats()
+
+    def expired(self, c, now):
+        return self.recycle is not None and now - c._activetime >= self.recycle
+
+    def take(self):
+        "an idle connection or None, without blocking"
+        if self.affinity:
+            c = getattr(self._local, 'conn', None)
+            if c is not None:
+                self._local.conn = None
+                try:
+                    self.idle.remove(c)
+                except ValueError:
+                    # taken by another thread
+                    pass
+                else:
+                    return c
+        try:
+            return self.idle.pop()
+        except IndexError:
+            return None
+
+    def _connect(self):
+        deadline = None
+        while 1:
+            c = self.take()
+            while c is not None:
+                c._idle = False
+                if not self.expired(c, time.time()):
+                    return c
+                self.metrics.recycled += 1
+                self.close(c)
+                c = self.take()
+            if self.inc_overflow():
+                try:
+                    return self.create_connection()
+                except:
+                    self.dec_overflow()
+                    raise
+            # slow path, wait for a checkin or a close
+            self.metrics.exhausted += 1
+            if deadline is None:
+                deadline = time.time() + self.timeout
+            with self._cond:
+                self._waiters += 1
+                try:
+                    while not self.idle and self.overflow >= 0:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise TimeoutError(
+                                "LifoPool limit of size %d, "
+                                "connection timed out, timeout %s" %
+                                (self.size(), self.timeout))
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+    def notify(self):
+        if self._waiters:
+            with self._cond:
+                self._cond.notify()
+
+    def return_conn(self, conn):
+        if getattr(conn, '_idle', False):
+            return
+        if not conn.open:
+            self.close(conn)
+            return
+        now = time.time()
+        if self.expired(conn, now):
+            self.metrics.recycled += 1
+            self.close(conn)
+            return
+        # idle time counts from the checkin
+        conn._activetime = now
+        conn._idle = True
+        self.idle.append(conn)
+        if self.affinity:
+            self._local.conn = conn
+        self.notify()
+
+    def dec_overflow(self):
+        QueuePool.dec_overflow(self)
+        # room for a new connection
+        self.notify()
+        return True
+
+    def maintain(self):
+        """
+        Close or ping cold connections from the idle end of the stack,
+        then refill to min_idle.
+        """
+        now = time.time()
+        for c in list(self.idle):
+            idle = now - c._activetime
+            expired = self.recycle is not None and idle >= self.recycle
+            stale = self.ping_after is not None and idle >= self.ping_after
+            if not expired and not stale:
+                continue
+            try:
+                self.idle.remove(c)
+            except ValueError:
+                # checked out meanwhile
+                continue
+            c._idle = False
+            if expired:
+                self.metrics.recycled += 1
+                self.close(c)
+                continue
+            try:
+                c.ping(False)
+            except:
+                self.metrics.ping_failures += 1
+                self.close(c)
+                continue
+            # keep its place at the cold end
+            c._idle = True
+            self.idle.appendleft(c)
+        self.fill()
+
+    def size(self):
+        return self.pool_size
+
+    def len(self):
+        return len(self.idle)
+
+    def clear(self):
+        while 1:
+            try:
+                c = self.idle.popleft()
+            except IndexError:
+                break
+            c._idle = False
+            self.close(c)
+
+
+POOL_CLASSES = {
+    'queue': QueuePool,
+    'lifo': LifoPool,
+}
+
+
 def im_close(conn):
-    if hasattr(conn, '_pool'):
-        conn._pool.return_conn(conn)
+    pool = getattr(conn, '_pool', None)
+    if pool is not None:
+        pool.metrics.checkins += 1
+        pool.return_conn(conn)
 
 def try_reconnect(conn):
     """true if success"""
@@ -169,6 +476,7 @@ def do_query(conn, sql, reconnect=True):
                 return do_query(conn, sql, False)
         # destroy the connection when connection broken or lost
         if e.args[0] in (2006, 2013):
+            conn._pool.metrics.broken += 1
             conn._pool.close(conn)
         raise
 
@@ -181,10 +489,39 @@ class PoolManager:
     def __init__(self, driver):
         self.driver = driver
         self.pools = {}
+        self._lock = threading.Lock()
 
-    def connect(self, **kw):
+    def get_pool(self, **kw):
+        """
+        Returns the pool of a server, creates it on first use.
+
+        :param min_idle: (optional)Idle connections kept warm by maintenance
+        :param ping_after: (optional)Ping connections idle longer than this (SEC)
+        :param maintain_interval: (optional)Run pool maintenance in a background
+                                  thread every this seconds, default 10 when
+                                  min_idle or ping_after is set
+        :param pool_class: (optional)'queue' (default), 'lifo' or a pool class
+        :param affinity: (optional)LifoPool gives a thread its last connection back
+        """
+        key = (kw['host'], kw['port'], kw['user'], kw['db'])
+        # every checkout comes here, only creating a pool takes the lock
+        pool = self.pools.get(key)
+        if pool is not None:
+            return pool
         pool_size = kw.pop('pool_size', 8)
         recycle = kw.pop('wait_timeout', 30)
+        min_idle = kw.pop('min_idle', 0)
+        ping_after = kw.pop('ping_after', None)
+        maintain_interval = kw.pop('maintain_interval', None)
+        if maintain_interval is None and (min_idle or ping_after is not None):
+            maintain_interval = 10
+        pool_class = kw.pop('pool_class', 'queue')
+        pool_class = POOL_CLASSES.get(pool_class, pool_class)
+        pool_kw = {}
+        if kw.pop('affinity', False):
+            assert pool_class is not QueuePool, \
+                "affinity is not supported by the queue pool, use pool_class='lifo'"
+            pool_kw['affinity'] = True
 
         def creator():
             c = self.driver.connect(**kw)
@@ -198,6 +535,22 @@ class PoolManager:
                 c.close = types.MethodType(im_close, c)
             return c
 
-        key = (kw['host'], kw['port'], kw['user'], kw['db'])
-        pool = self.pools.setdefault(key, QueuePool(creator, pool_size=pool_size, recycle=recycle))
-        return pool.connect()
+        with self._lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = pool_class(creator, pool_size=pool_size, recycle=recycle,
+                                  min_idle=min_idle, ping_after=ping_after, **pool_kw)
+                if maintain_interval:
+                    pool.start_maintenance(maintain_interval)
+                self.pools[key] = pool
+        return pool
+
+    def connect(self, **kw):
+        return self.get_pool(**kw).connect()
+
+    def stats(self):
+        """
+        Snapshot of every pool's counters, keyed by 'user@host:port/db'.
+        """
+        return dict(("{2}@{0}:{1}/{3}".format(*key), pool.stats())
+                    for key, pool in list(self.pools.items()))